@@ -0,0 +1,167 @@
+from itertools import chain
+from statistics import NormalDist
+
+import numpy as np
+
+# --- Vectorized anomaly scoring for Radar Mode ---
+# Every monitored series (daily encounter counts per chief complaint,
+# encounter type or condition) is one row of a (series x day) matrix, and
+# each statistic below is computed for all rows at once:
+#   - a day-of-week profile, giving each series its own weekly seasonality
+#   - an EWMA of the deseasonalized level, the recent run rate
+#   - expected = level x the profile factor for the evaluated weekday
+#   - sigma from the residuals around the weekly profile, floored at the
+#     Poisson variance so sparse series do not produce huge z-scores, and
+#     widened by the noise the EWMA carries into `expected`
+# The alert threshold is Bonferroni-corrected for the number of series tested.
+# Daily counts are skewed, so the realized false-alarm rate runs above the
+# nominal one: 3000 simulated Poisson series with means of 8-100 raise 0.1-1.2
+# alerts per scan at the default 0.05, against 20-40 at a flat z >= 3.
+
+
+def build_series(day_ages, day_counts, num_days):
+    """Builds the (series x day) count matrix whose last column is the evaluated day.
+
+    `day_ages[i]` lists days before the evaluated day (0 = that day) and
+    `day_counts[i]` the matching counts for series i, as returned by a
+    groupArray() per series. Days outside the range are ignored; missing
+    days count as zero.
+    """
+    lengths = np.fromiter(map(len, day_ages), dtype=np.intp, count=len(day_ages))
+    total = int(lengths.sum())
+    ages = np.fromiter(chain.from_iterable(day_ages), dtype=np.intp, count=total)
+    counts = np.fromiter(chain.from_iterable(day_counts), dtype=np.float64, count=total)
+    rows = np.repeat(np.arange(len(day_ages)), lengths)
+    cols = num_days - 1 - ages
+    matrix = np.zeros((len(day_ages), num_days))
+    in_range = (cols >= 0) & (cols < num_days)
+    np.add.at(matrix, (rows[in_range], cols[in_range]), counts[in_range])
+    return matrix
+
+
+def score_series(matrix, end_day, alpha=0.3):
+    """Scores the last column of `matrix` against the columns before it. Returns a dict of per-series arrays."""
+    history, current = matrix[:, :-1], matrix[:, -1]
+    num_days = matrix.shape[1]
+
+    # Weekday of every column, and the weekday being evaluated
+    weekdays = (np.arange(num_days) + end_day.weekday() - (num_days - 1)) % 7
+    history_weekdays, current_weekday = weekdays[:-1], weekdays[-1]
+    one_hot = np.eye(7)[history_weekdays]
+    profile = np.divide(history @ one_hot, one_hot.sum(axis=0), out=np.zeros((len(matrix), 7)),
+                        where=one_hot.sum(axis=0) > 0)
+
+    baseline = history.mean(axis=1)
+    factors = np.divide(profile, baseline[:, None], out=np.ones_like(profile), where=baseline[:, None] > 0)
+
+    # EWMA of the deseasonalized series, newest day weighted most. A weekday
+    # with no history (a clinic closed on Sundays) has a factor of 0; its days
+    # are all zero, so any positive divisor leaves them at 0 in the level.
+    divisors = np.where(factors > 0, factors, 1.0)
+    weights = alpha * (1 - alpha) ** np.arange(history.shape[1] - 1, -1, -1)
+    level = (history / divisors[:, history_weekdays]) @ (weights / weights.sum())
+    expected = level * factors[:, current_weekday]
+
+    # The weekly profile fits 7 means, so they come off the degrees of freedom
+    residuals = history - profile[:, history_weekdays]
+    dof = history.shape[1] - np.count_nonzero(one_hot.sum(axis=0))
+    variance = (residuals ** 2).sum(axis=1) / dof if dof > 0 else np.zeros(len(matrix))
+    # The prediction error is the day's own noise plus the EWMA's, whose
+    # variance is alpha / (2 - alpha) of it in steady state
+    ewma_share = alpha / (2 - alpha)
+    sigma = np.sqrt(np.maximum(np.maximum(variance, expected), 1.0) * (1 + ewma_share))
+
+    return {
+        "current": current,
+        "expected": expected,
+        "baseline": baseline,
+        "ewma": level,
+        "seasonal": profile[:, current_weekday],
+        "z": (current - expected) / sigma,
+        "change": np.divide(current - expected, expected, out=np.full_like(expected, np.nan), where=expected > 0) * 100
+    }
+
+
+def format_change(pct, current):
+    if np.isnan(pct):
+        return "new" if current > 0 else "0%"
+    return f"{pct:+.0f}%"
+
+
+def alert_threshold(num_tests, false_alarm_rate, z_min=0.0):
+    """Two-sided Bonferroni z threshold: `num_tests` null series exceed it `false_alarm_rate` times on average."""
+    if num_tests < 1:
+        return z_min
+    return max(z_min, NormalDist().inv_cdf(1 - false_alarm_rate / (2 * num_tests)))
+
+
+def detect_anomalies(dimensions, values, day_ages, day_counts, end_day, history_days=56, alpha=0.3,
+                     false_alarm_rate=0.05, z_medium=3.0, z_high=4.0, min_count=5, limit=None):
+    """Finds the series whose count on `end_day` departs from expectation, most anomalous first.
+
+    Inputs are columns with one entry per series (see build_series). Only
+    series whose observed or expected count reaches `min_count` are tested,
+    and one is reported when |z| clears the Bonferroni threshold for that
+    many tests (see alert_threshold), never lower than `z_medium`. It is
+    marked high severity `z_high - z_medium` above the threshold in use.
+    """
+    if not len(dimensions):
+        return []
+    keys = list(zip(dimensions, values))
+    matrix = build_series(day_ages, day_counts, history_days + 1)
+    scores = score_series(matrix, end_day, alpha)
+
+    z = scores["z"]
+    volume = np.maximum(scores["current"], scores["expected"])
+    tested = volume >= min_count
+    z_medium = alert_threshold(int(np.count_nonzero(tested)), false_alarm_rate, z_medium)
+    z_high = z_medium + max(z_high - z_medium, 0.0)
+    flagged = np.flatnonzero((np.abs(z) >= z_medium) & tested)
+    flagged = flagged[np.argsort(-np.abs(z[flagged]), kind="stable")][:limit]
+
+    anomalies = []
+    for i in flagged:
+        dimension, value = keys[i]
+        anomalies.append({
+            "series": f"{dimension}:{value}",
+            "dimension": dimension,
+            "value": value,
+            "day": end_day.isoformat(),
+            "current": int(scores["current"][i]),
+            "expected": round(float(scores["expected"][i]), 1),
+            "baseline": round(float(scores["baseline"][i]), 1),
+            "ewma": round(float(scores["ewma"][i]), 1),
+            "seasonal": round(float(scores["seasonal"][i]), 1),
+            "zScore": round(float(z[i]), 2),
+            "change": format_change(scores["change"][i], scores["current"][i]),
+            "direction": "up" if z[i] > 0 else "down",
+            "severity": "high" if abs(z[i]) >= z_high else "medium"
+        })
+    return anomalies
+
+
+if __name__ == "__main__":
+    # Regression checks on simulated Poisson series: `python anomaly.py`
+    from datetime import date
+
+    def simulate(rng, num_series, rate, weekly, end_day):
+        ages = np.arange(57)
+        means = rate * weekly[(end_day.weekday() - ages) % 7]
+        counts = rng.poisson(means, size=(num_series, len(ages)))
+        return (["check"] * num_series, [str(i) for i in range(num_series)],
+                [ages.tolist()] * num_series, counts.tolist())
+
+    rng = np.random.default_rng(0)
+    sunday = date(2025, 9, 28)
+
+    # Closed on Sundays: a zero Sunday is expected, not a -100% drop
+    closed_sundays = np.array([1, 1, 1, 1, 1, 1, 0.0])
+    flagged = detect_anomalies(*simulate(rng, 200, 40, closed_sundays, sunday), sunday)
+    assert not flagged, f"{len(flagged)} closed-Sunday series flagged"
+
+    # Pure noise stays near the nominal false-alarm rate, and a spike is still caught
+    dimensions, values, ages, counts = simulate(rng, 3000, 20, np.ones(7), sunday)
+    assert len(detect_anomalies(dimensions, values, ages, counts, sunday)) <= 3
+    counts[0][0] = 60
+    assert [a["series"] for a in detect_anomalies(dimensions, values, ages, counts, sunday)][:1] == ["check:0"]
+    print("anomaly checks passed")
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+from serialization import json_dumps
+
+
+def diff_alerts(previous, current):
+    """Returns (changed, removed_keys) between two alert lists, matching alerts by their "key"."""
+    before = {alert["key"]: alert for alert in previous}
+    changed = [alert for alert in current if before.get(alert["key"]) != alert]
+    current_keys = {alert["key"] for alert in current}
+    removed = [key for key in before if key not in current_keys]
+    return changed, removed
+
+
+def format_sse(event, data, event_id=None):
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json_dumps(data)}\n\n"
+
+
+class Subscription:
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class AlertBroadcaster:
+    """Fans Radar alert changes out to every connected stream.
+
+    Each subscriber has a bounded queue. A subscriber that falls behind does not
+    hold up the others: its backlog is dropped and replaced by a single full
+    snapshot, so it catches up in one message instead of replaying every delta.
+    """
+
+    def __init__(self, queue_size=16):
+        self.queue_size = queue_size
+        self.latest = None
+        self._subscribers = set()
+
+    def subscribe(self):
+        subscription = Subscription(self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    async def on_scan(self, snapshot, previous):
+        """RadarScanner listener: publishes only the alerts that are new or changed since the last scan."""
+        self.latest = snapshot
+        changed, removed = diff_alerts(previous["alerts"] if previous else [], snapshot["alerts"])
+        if not changed and not removed and previous and previous["metrics"] == snapshot["metrics"]:
+            return
+        self.publish("alerts", {
+            "version": snapshot["version"],
+            "lastScan": snapshot["lastScan"],
+            "changed": changed,
+            "removed": removed,
+            "order": [alert["key"] for alert in snapshot["alerts"]],
+            "metrics": snapshot["metrics"]
+        })
+
+    def publish(self, event, data):
+        for subscription in list(self._subscribers):
+            try:
+                subscription.queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                self._resync(subscription)
+
+    def _resync(self, subscription):
+        queue = subscription.queue
+        subscription.dropped += queue.qsize()
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(("snapshot", self.latest))
+        logging.warning(f"Alert stream subscriber fell behind; dropped {subscription.dropped} events so far")
@@ -0,0 +1,217 @@
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+from clickhouse_driver import Client
+from clickhouse_driver import errors as ch_errors
+
+# Errors that mean the connection itself is unusable (as opposed to a bad query).
+CONNECTION_ERRORS = (
+    ch_errors.NetworkError,
+    ch_errors.SocketTimeoutError,
+    ch_errors.UnexpectedPacketFromServerError,
+    EOFError,
+    OSError,
+)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no ClickHouse connection could be checked out in time."""
+
+
+class _PooledConnection:
+    def __init__(self, client):
+        self.client = client
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+
+
+class ClickHousePool:
+    """Bounded, thread-safe pool of native ClickHouse connections.
+
+    A clickhouse_driver.Client wraps a single native-protocol connection and
+    must not be shared between concurrent requests, so each caller checks one
+    out for the duration of its query and returns it afterwards.
+    """
+
+    def __init__(self, max_size=10, min_size=1, max_idle_time=300,
+                 health_check_interval=30, checkout_timeout=10, **client_kwargs):
+        self.max_size = max_size
+        self.min_size = min_size
+        self.max_idle_time = max_idle_time
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        self.client_kwargs = client_kwargs
+
+        self._idle = deque()
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {"created": 0, "discarded": 0, "evicted": 0, "reconnects": 0, "checkouts": 0}
+
+    # --- Connection lifecycle ---
+
+    def _create(self):
+        conn = _PooledConnection(Client(**self.client_kwargs))
+        self._count("created")
+        return conn
+
+    def _count(self, stat):
+        with self._cond:
+            self._stats[stat] += 1
+
+    def _close(self, conn):
+        try:
+            conn.client.disconnect()
+        except Exception as e:
+            logging.warning(f"Error closing ClickHouse connection: {str(e)}")
+
+    def _is_healthy(self, conn):
+        """Pings connections that have been idle longer than the check interval."""
+        now = time.monotonic()
+        if now - conn.last_checked < self.health_check_interval:
+            return True
+        try:
+            conn.client.execute('SELECT 1')
+            conn.last_checked = now
+            return True
+        except Exception as e:
+            logging.warning(f"ClickHouse health check failed, discarding connection: {str(e)}")
+            return False
+
+    def _evict_idle(self):
+        """Drops connections idle longer than max_idle_time, keeping min_size around. Caller holds the lock."""
+        now = time.monotonic()
+        expired = []
+        while self._idle and self._size > self.min_size and now - self._idle[0].last_used > self.max_idle_time:
+            expired.append(self._idle.popleft())
+            self._size -= 1
+            self._stats["evicted"] += 1
+        return expired
+
+    # --- Checkout / return ---
+
+    def acquire(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("ClickHouse pool is closed")
+                expired = self._evict_idle()
+                if self._idle:
+                    # Most recently used first, so cold connections age out.
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(f"Timed out waiting for a ClickHouse connection (pool size {self.max_size})")
+                self._cond.wait(remaining)
+            self._stats["checkouts"] += 1
+
+        for old in expired:
+            self._close(old)
+
+        if conn is None:
+            try:
+                return self._create()
+            except Exception:
+                self._release_slot()
+                raise
+
+        if not self._is_healthy(conn):
+            self._close(conn)
+            self._count("reconnects")
+            try:
+                return self._create()
+            except Exception:
+                self._release_slot()
+                raise
+        return conn
+
+    def release(self, conn, discard=False):
+        if not discard:
+            conn.last_used = time.monotonic()
+            # Checked under the same lock as the append, so a connection
+            # returned while close() runs is closed rather than left idle.
+            with self._cond:
+                if not self._closed:
+                    self._idle.append(conn)
+                    self._cond.notify()
+                    return
+        self._close(conn)
+        self._count("discarded")
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Checks out a raw clickhouse_driver.Client for the duration of the block."""
+        conn = self.acquire()
+        try:
+            yield conn.client
+        except ch_errors.ServerException:
+            # The server rejected the query; the connection itself is fine.
+            self.release(conn)
+            raise
+        except BaseException:
+            # Network failure or a query interrupted mid-stream; don't reuse the socket.
+            self.release(conn, discard=True)
+            raise
+        else:
+            self.release(conn)
+
+    def execute(self, *args, retry=True, **kwargs):
+        """Runs a query on a pooled connection, retrying once on a fresh connection if it dropped.
+
+        A dropped connection usually means the server restarted, in which case
+        every idle socket is dead too; they are all discarded so the retry
+        opens a new connection instead of picking up another stale one.
+        """
+        try:
+            with self.connection() as ch:
+                return ch.execute(*args, **kwargs)
+        except CONNECTION_ERRORS as e:
+            if not retry:
+                raise
+            logging.warning(f"ClickHouse connection failed, retrying on a fresh connection: {str(e)}")
+            self._count("reconnects")
+            self._discard_idle()
+            with self.connection() as ch:
+                return ch.execute(*args, **kwargs)
+
+    def _discard_idle(self):
+        """Closes every idle connection and frees its slot."""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._stats["discarded"] += len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+        self._discard_idle()
+
+    def stats(self):
+        with self._cond:
+            return {
+                **self._stats,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+            }
@@ -0,0 +1,39 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# --- Thread pools for blocking I/O ---
+# clickhouse_driver and the OpenAI client are synchronous, so calling them
+# straight from an async endpoint blocks uvicorn's event loop. Each kind of
+# call gets its own sized pool so a burst of slow LLM requests cannot starve
+# the database queries (and vice versa).
+
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", os.getenv("CLICKHOUSE_POOL_SIZE", 10)))
+LLM_EXECUTOR_WORKERS = int(os.getenv("LLM_EXECUTOR_WORKERS", 16))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="clickhouse")
+llm_executor = ThreadPoolExecutor(max_workers=LLM_EXECUTOR_WORKERS, thread_name_prefix="openai")
+
+
+async def _run(executor, fn, *args, **kwargs):
+    # Copy the context so ddtrace spans started in the request follow the call into the worker thread.
+    ctx = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(ctx.run, fn, *args, **kwargs))
+
+
+async def run_db(fn, *args, **kwargs):
+    """Runs a blocking ClickHouse call on the database thread pool."""
+    return await _run(db_executor, fn, *args, **kwargs)
+
+
+async def run_llm(fn, *args, **kwargs):
+    """Runs a blocking OpenAI call on the LLM thread pool."""
+    return await _run(llm_executor, fn, *args, **kwargs)
+
+
+def shutdown_executors():
+    db_executor.shutdown(wait=False, cancel_futures=True)
+    llm_executor.shutdown(wait=False, cancel_futures=True)
@@ -1,18 +1,33 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional
 from openai import OpenAI
-from clickhouse_driver import Client
 import os
 from dotenv import load_dotenv
-import json
 import time
 import logging
+import asyncio
+import threading
+from datetime import timedelta
 
 # Import and configure ddtrace for Datadog
 import ddtrace
 from ddtrace.llmobs import LLMObs
 
+from clickhouse_pool import ClickHousePool
+from executors import run_db, run_llm, shutdown_executors
+from response_cache import ResponseCache, VersionedCache, etag_matches
+from serialization import FastJSONResponse, columns_to_rows, json_dumps, json_loads
+from sql_cache import TranslationCache, load_local_embedder, schema_fingerprint
+from anomaly import detect_anomalies
+from broadcaster import AlertBroadcaster, format_sse
+from profile_cache import ProfileCache, profile_fingerprint
+from radar import RadarScanner, RollingWindowCounts
+from sql_guard import (UnsafeQueryError, InvalidCursorError, clean_sql, has_order_by, paginate_sql, query_settings,
+                       encode_cursor, decode_cursor)
+
 # --- Configuration & Initialization ---
 
 # Load environment variables from .env file
@@ -25,7 +40,7 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 LLMObs.enable()
 
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # --- In-Memory Metrics Store ---
 # For a hackathon, in-memory is fine. In production, you'd use Redis or another tool.
@@ -66,23 +81,86 @@ app.add_middleware(
 # Initialize OpenAI
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# Initialize ClickHouse
+# Initialize ClickHouse connection pool
 try:
-    clickhouse_client = Client(
+    clickhouse_pool = ClickHousePool(
         host=os.getenv("CLICKHOUSE_HOST"),
         port=int(os.getenv("CLICKHOUSE_PORT", 9000)),
         database=os.getenv("CLICKHOUSE_DB"),
         user=os.getenv("CLICKHOUSE_USER"),
-        password=os.getenv("CLICKHOUSE_PASSWORD")
+        password=os.getenv("CLICKHOUSE_PASSWORD"),
+        max_size=int(os.getenv("CLICKHOUSE_POOL_SIZE", 10)),
+        min_size=int(os.getenv("CLICKHOUSE_POOL_MIN_SIZE", 1)),
+        max_idle_time=float(os.getenv("CLICKHOUSE_POOL_MAX_IDLE_SECONDS", 300)),
+        health_check_interval=float(os.getenv("CLICKHOUSE_POOL_HEALTH_CHECK_SECONDS", 30)),
+        checkout_timeout=float(os.getenv("CLICKHOUSE_POOL_TIMEOUT_SECONDS", 10))
     )
-    clickhouse_client.execute('SELECT 1')
+    clickhouse_pool.execute('SELECT 1')
     print("✅ ClickHouse connected successfully")
 except Exception as e:
     print(f"❌ ClickHouse connection failed: {str(e)}")
-    clickhouse_client = None
+    clickhouse_pool = None
+
+# Called by the Radar shutdown hook once the scan loop has stopped, so an
+# in-flight scan never runs against shut-down executors or a closed pool.
+def close_clickhouse_pool():
+    shutdown_executors()
+    if clickhouse_pool:
+        clickhouse_pool.close()
+
+# Table layout created by scripts/setup_database.py --data-model. "normalized"
+# splits patient attributes (patient_dim, one row per patient) from encounters;
+# `patients` is then a view over the two, kept for Query Mode's generated SQL.
+DATA_MODEL = os.getenv("CLICKHOUSE_DATA_MODEL", "wide").lower()
+NORMALIZED = DATA_MODEL == "normalized"
+ENCOUNTERS_TABLE = "encounters" if NORMALIZED else "patients"
+# patient_dim only drops a reloaded patient's older rows when parts merge, so
+# anything read as exact from it goes through FINAL.
+PATIENT_COUNT_QUERY = "SELECT count() FROM patient_dim FINAL" if NORMALIZED else "SELECT COUNT(DISTINCT patient_id) FROM patients"
+
+QUERY_PAGE_SIZE = 20
 
 class QueryRequest(BaseModel):
-    question: str
+    question: str = ""
+    stream: bool = False
+    page_size: int = Field(QUERY_PAGE_SIZE, ge=1, le=100)
+    # Opaque token from a previous response's nextCursor; fetches the next page of that query.
+    cursor: Optional[str] = None
+
+    @model_validator(mode="after")
+    def require_question_or_cursor(self):
+        if bool(self.question.strip()) == bool(self.cursor):
+            raise ValueError("Provide exactly one of 'question' or 'cursor'")
+        return self
+
+SQL_SYSTEM_PROMPT = """You are a SQL query generator for a ClickHouse database with a patients table.
+
+Table schema (table name: patients):
+- patient_id (String)
+- age (Int32)
+- conditions (Array(String))
+- last_a1c_date (Date)
+- encounter_date (DateTime)
+- chief_complaint (String)
+- encounter_type (String)
+
+IMPORTANT: Always use the table name 'patients' in your queries.
+
+CRITICAL ClickHouse syntax rules:
+- To check if an array contains a value, use has(array_column, 'value') NOT 'value' IN array_column
+- Example: has(conditions, 'COPD') NOT 'COPD' IN conditions
+
+Generate a valid ClickHouse SQL query based on the user's question. Return ONLY the SQL query, no explanation."""
+
+# --- Natural language -> SQL translation cache ---
+# Keyed on the normalized question; entries are invalidated whenever the schema prompt changes.
+sql_cache = TranslationCache(
+    max_entries=int(os.getenv("SQL_CACHE_MAX_ENTRIES", 512)),
+    ttl=float(os.getenv("SQL_CACHE_TTL_SECONDS", 3600)),
+    schema_version=schema_fingerprint(SQL_SYSTEM_PROMPT, "gpt-4o"),
+    embed_fn=load_local_embedder(os.getenv("SQL_CACHE_EMBEDDING_MODEL")) if os.getenv("SQL_CACHE_EMBEDDING_MODEL") else None,
+    similarity_threshold=float(os.getenv("SQL_CACHE_SIMILARITY_THRESHOLD", 0.93))
+)
 
 # --- Helper function to wrap OpenAI calls for Datadog MCP ---
 @ddtrace.llmobs.llm(model_name="gpt-4o", name="clinical_summary")
@@ -122,214 +200,579 @@ def create_traced_json_completion(messages):
             span.set_tag("error.message", str(e))
         raise
 
+# --- Non-blocking wrappers for ClickHouse and OpenAI ---
+async def ch_execute(*args, **kwargs):
+    """Runs a query on a pooled ClickHouse connection without blocking the event loop."""
+    return await run_db(clickhouse_pool.execute, *args, **kwargs)
+
+async def chat_completion(**kwargs):
+    """Runs an OpenAI chat completion on the LLM thread pool."""
+    return await run_llm(client.chat.completions.create, **kwargs)
+
+class CompletionStream:
+    """Async iterator of a streamed completion's text deltas.
+
+    The completion is read on the LLM thread pool from the moment the stream
+    is created, so callers must cancel() it once they are done with it, even
+    if they never iterated; closing the iterator alone does not stop a
+    stream that was never started.
+    """
+
+    def __init__(self, deltas, cancelled):
+        self._deltas = deltas
+        self._cancelled = cancelled
+
+    def __aiter__(self):
+        return self._deltas
+
+    def cancel(self):
+        """Stops reading from OpenAI; the LLM thread is released at the next chunk."""
+        self._cancelled.set()
+
+def stream_chat_completion(**kwargs):
+    """Starts a streamed OpenAI completion on the LLM thread pool and returns it as a CompletionStream."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+    done = object()
+    
+    def produce():
+        try:
+            if cancelled.is_set():
+                return
+            for chunk in client.chat.completions.create(stream=True, **kwargs):
+                if cancelled.is_set():
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk.choices[0].delta.content)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+    
+    producer = asyncio.ensure_future(run_llm(produce))
+    
+    async def deltas():
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            await producer
+        finally:
+            # Stop reading from OpenAI if the client went away mid-stream.
+            cancelled.set()
+    
+    return CompletionStream(deltas(), cancelled)
+
 # ========== API ENDPOINTS ==========
 
 @app.get("/api/metrics")
 async def get_metrics():
     """Exposes internal application metrics."""
-    return metrics
+    return {
+        **metrics,
+        "clickhouse_pool": clickhouse_pool.stats() if clickhouse_pool else None,
+        "sql_cache": sql_cache.stats(),
+        "alert_stream_subscribers": alert_broadcaster.subscriber_count,
+        "analytics_cache": analytics_cache.stats(),
+        "profile_cache": profile_cache.stats(),
+        "population_cache": population_cache.stats(),
+        "radar_window": radar_window.stats()
+    }
 
 # ========== QUERY MODE ENDPOINT ==========
-@app.post("/api/query")
-async def query_patients(request: QueryRequest):
+async def translate_question(question):
+    """Turns a clinician's question into ClickHouse SQL, consulting the translation cache first."""
+    sql_query = sql_cache.get(question)
+    if sql_query is None and sql_cache.semantic_enabled:
+        sql_query = await run_llm(sql_cache.get_similar, question)
+    if sql_query is not None:
+        return sql_query
+    
+    parse_response = await chat_completion(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "system",
+                "content": SQL_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": question
+            }
+        ]
+    )
+    
+    sql_query = parse_response.choices[0].message.content.strip()
+    
+    if sql_query.startswith("```"):
+        sql_query = sql_query.split("```")[1]
+        if sql_query.startswith("sql"):
+            sql_query = sql_query[3:]
+        sql_query = sql_query.strip()
+    
+    if sql_cache.semantic_enabled:
+        await run_llm(sql_cache.put, question, sql_query)
+    else:
+        sql_cache.put(question, sql_query)
+    return sql_query
+
+async def fetch_query_results(question, sql_query, offset=0, page_size=QUERY_PAGE_SIZE):
+    """Executes one page of generated SQL; returns (rows as dicts, whether more rows exist)."""
+    if not clickhouse_pool:
+        return [], False
     try:
-        parse_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """You are a SQL query generator for a ClickHouse database with a patients table.
-                    
-                    Table schema (table name: patients):
-                    - patient_id (String)
-                    - age (Int32)
-                    - conditions (Array(String))
-                    - last_a1c_date (Date)
-                    - encounter_date (DateTime)
-                    - chief_complaint (String)
-                    - encounter_type (String)
-                    
-                    IMPORTANT: Always use the table name 'patients' in your queries.
-                    
-                    CRITICAL ClickHouse syntax rules:
-                    - To check if an array contains a value, use has(array_column, 'value') NOT 'value' IN array_column
-                    - Example: has(conditions, 'COPD') NOT 'COPD' IN conditions
-                    
-                    Generate a valid ClickHouse SQL query based on the user's question. Return ONLY the SQL query, no explanation."""
-                },
-                {
-                    "role": "user",
-                    "content": request.question
-                }
-            ]
-        )
+        sql = clean_sql(sql_query)
+        # Output columns decide the page order; DESCRIBE reads no data.
+        columns = [] if has_order_by(sql) else [row[0] for row in await ch_execute(f"DESCRIBE TABLE ({sql})")]
+        # Ask for one extra row to learn whether there is a next page.
+        paged_sql = paginate_sql(sql, page_size + 1, offset, columns)
+        result = await ch_execute(paged_sql, with_column_types=True, columnar=True, settings=query_settings(page_size + 1))
+    except Exception:
+        # Don't keep serving SQL that was rejected.
+        if question:
+            sql_cache.discard(question)
+        raise
+    columns, column_types = result[0], result[1]
+    row_count = len(columns[0]) if columns else 0
+    
+    results = columns_to_rows(column_types, columns, limit=page_size)
+    return results, row_count > page_size
+
+def next_cursor(sql_query, offset, page_size, has_more):
+    return encode_cursor(sql_query, offset + page_size, page_size) if has_more else None
+
+def narrative_messages(question, results):
+    return [
+        {
+            "role": "system",
+            "content": "You are a clinical AI assistant. Summarize patient query results in 2-3 sentences with actionable insights."
+        },
+        {
+            "role": "user",
+            "content": f"Query: {question}\n\nResults: {len(results)} patients found.\nData: {json_dumps(results[:5])}\n\nProvide a brief clinical summary."
+        }
+    ]
+
+def format_query_results(results):
+    formatted_results = []
+    for r in results:
+        formatted_results.append({
+            "id": r.get("patient_id", "Unknown"),
+            "name": f"Patient {r.get('patient_id', 'Unknown')}",
+            "age": r.get("age", 0),
+            "lastTest": str(r.get("last_a1c_date", "N/A")),
+            "overdue": "N/A"
+        })
+    return formatted_results
+
+async def stream_query_events(question, page_size=QUERY_PAGE_SIZE):
+    """Yields NDJSON events: the SQL, then the patient rows, then the narrative token by token."""
+    start_time = time.time()
+    try:
+        sql_query = await translate_question(question)
+        yield json_dumps({"type": "sql", "sql": sql_query}) + "\n"
         
-        sql_query = parse_response.choices[0].message.content.strip()
+        results, has_more = await fetch_query_results(question, sql_query, page_size=page_size)
+        # Start the narrative before shaping/sending rows so the LLM round-trip overlaps them.
+        narrative_stream = stream_chat_completion(model="gpt-4o", messages=narrative_messages(question, results))
+        try:
+            yield json_dumps({
+                "type": "results",
+                "results": format_query_results(results),
+                "nextCursor": next_cursor(sql_query, 0, page_size, has_more)
+            }) + "\n"
+            
+            async for delta in narrative_stream:
+                yield json_dumps({"type": "narrative", "delta": delta}) + "\n"
+        finally:
+            # Also covers a disconnect before the narrative was ever read.
+            narrative_stream.cancel()
         
-        if sql_query.startswith("```"):
-            sql_query = sql_query.split("```")[1]
-            if sql_query.startswith("sql"):
-                sql_query = sql_query[3:]
-            sql_query = sql_query.strip()
+        yield json_dumps({"type": "done", "executionTime": int((time.time() - start_time) * 1000)}) + "\n"
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band.
+        logging.error(f"Error in streaming query endpoint: {str(e)}")
+        yield json_dumps({"type": "error", "detail": str(e)}) + "\n"
+
+@app.post("/api/query")
+async def query_patients(request: QueryRequest):
+    if request.cursor:
+        return await fetch_query_page(request.cursor)
+    
+    if request.stream:
+        return StreamingResponse(
+            stream_query_events(request.question, request.page_size),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    try:
+        sql_query = await translate_question(request.question)
         
         print(f"Generated SQL: {sql_query}")
         
-        if clickhouse_client:
-            result = clickhouse_client.execute(sql_query, with_column_types=True)
-            rows = result[0]
-            columns = [col[0] for col in result[1]]
-            
-            results = []
-            for row in rows[:20]:
-                row_dict = {}
-                for i, col in enumerate(columns):
-                    value = row[i]
-                    if hasattr(value, 'isoformat'):
-                        row_dict[col] = value.isoformat()
-                    else:
-                        row_dict[col] = value
-                results.append(row_dict)
-        else:
-            results = []
+        results, has_more = await fetch_query_results(request.question, sql_query, page_size=request.page_size)
         
-        narrative_response = client.chat.completions.create(
+        narrative_response = await chat_completion(
             model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a clinical AI assistant. Summarize patient query results in 2-3 sentences with actionable insights."
-                },
-                {
-                    "role": "user",
-                    "content": f"Query: {request.question}\n\nResults: {len(results)} patients found.\nData: {json.dumps(results[:5])}\n\nProvide a brief clinical summary."
-                }
-            ]
+            messages=narrative_messages(request.question, results)
         )
         
         narrative = narrative_response.choices[0].message.content
         
-        formatted_results = []
-        for r in results:
-            formatted_results.append({
-                "id": r.get("patient_id", "Unknown"),
-                "name": f"Patient {r.get('patient_id', 'Unknown')}",
-                "age": r.get("age", 0),
-                "lastTest": str(r.get("last_a1c_date", "N/A")),
-                "overdue": "N/A"
-            })
-        
-        return {
+        return FastJSONResponse({
             "sql": sql_query,
-            "results": formatted_results,
+            "results": format_query_results(results),
             "narrative": narrative,
+            "nextCursor": next_cursor(sql_query, 0, request.page_size, has_more),
             "executionTime": 450
-        }
+        })
         
+    except UnsafeQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logging.error(f"Error in query endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# ========== RADAR MODE ENDPOINT ==========
-@app.get("/api/alerts")
-async def get_alerts():
+async def fetch_query_page(cursor):
+    """Serves a follow-up page for a previous query without another LLM round-trip."""
     try:
-        raw_alerts = []
-        if clickhouse_client:
-            # Simple hardcoded queries that work
-            queries = [
-                {
-                    "sql": "SELECT chief_complaint, COUNT(*) as count FROM patients WHERE encounter_date >= now() - INTERVAL 7 DAY GROUP BY chief_complaint ORDER BY count DESC LIMIT 3",
-                    "type": "recent_complaints",
-                    "description": "Top chief complaints in last 7 days"
-                },
-                {
-                    "sql": "SELECT encounter_type, COUNT(*) as count FROM patients GROUP BY encounter_type ORDER BY count DESC",
-                    "type": "encounter_types",
-                    "description": "Encounter type distribution"
-                }
-            ]
-            
-            for query_obj in queries:
-                try:
-                    result = clickhouse_client.execute(query_obj["sql"])
-                    serializable_result = []
-                    if result:
-                        for row in result:
-                            serializable_row = []
-                            for item in row:
-                                if hasattr(item, 'isoformat'):
-                                    serializable_row.append(item.isoformat())
-                                else:
-                                    serializable_row.append(item)
-                            serializable_result.append(serializable_row)
-                    
-                    raw_alerts.append({
-                        "type": query_obj["type"],
-                        "description": query_obj["description"],
-                        "result": serializable_result[0] if serializable_result else None
-                    })
-                except Exception as e:
-                    print(f"Query failed: {query_obj['sql']}, Error: {e}")
-        
-        if not raw_alerts:
-            raw_alerts = [
-                {"type": "chest_pain", "description": "Recent chest pain cases", "result": ["Chest pain", 15]},
-                {"type": "er_visits", "description": "ER visit distribution", "result": ["ED", 89]}
-            ]
-        
-        alert_analysis_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
+        sql_query, offset, page_size = decode_cursor(cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        results, has_more = await fetch_query_results(None, sql_query, offset=offset, page_size=page_size)
+        return FastJSONResponse({
+            "sql": sql_query,
+            "results": format_query_results(results),
+            "narrative": None,
+            "nextCursor": next_cursor(sql_query, offset, page_size, has_more)
+        })
+    except Exception as e:
+        logging.error(f"Error fetching query page: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ========== PATIENT POPULATION ==========
+# Part count/row count/modification time of the source tables: changes whenever encounters are loaded.
+DATA_VERSION_QUERY = """
+SELECT count(), sum(rows), max(modification_time) FROM system.parts
+WHERE database = currentDatabase() AND table IN ('patients', 'patient_dim', 'encounters') AND active
+"""
+
+async def data_version():
+    return tuple(str(value) for value in (await ch_execute(DATA_VERSION_QUERY))[0])
+
+# The patient_population rollup holds a uniqCombined (HyperLogLog) state kept
+# current by a materialized view (see scripts/setup_database.py), so the
+# approximate count reads a handful of rows. In the normalized layout a plain
+# count() on patient_dim is cheap, and only over-counts patients reloaded
+# since the last merge.
+POPULATION_USE_ROLLUP = os.getenv("POPULATION_USE_ROLLUP", "true").lower() == "true"
+if NORMALIZED:
+    APPROXIMATE_PATIENT_COUNT_QUERY = "SELECT count() FROM patient_dim"
+elif POPULATION_USE_ROLLUP:
+    APPROXIMATE_PATIENT_COUNT_QUERY = "SELECT uniqCombinedMerge(patients) FROM patient_population"
+else:
+    APPROXIMATE_PATIENT_COUNT_QUERY = "SELECT uniqCombined(patient_id) FROM patients"
+FALLBACK_PATIENT_COUNT_QUERY = "SELECT uniqCombined(patient_id) FROM patients"
+
+async def count_patients(exact=False):
+    if exact:
+        return (await ch_execute(PATIENT_COUNT_QUERY))[0][0]
+    try:
+        return (await ch_execute(APPROXIMATE_PATIENT_COUNT_QUERY))[0][0]
+    except Exception as e:
+        if APPROXIMATE_PATIENT_COUNT_QUERY == FALLBACK_PATIENT_COUNT_QUERY:
+            raise
+        # e.g. a database set up before the patient_population rollup existed
+        logging.warning(f"Population rollup query failed, counting from patients: {str(e)}")
+        return (await ch_execute(FALLBACK_PATIENT_COUNT_QUERY))[0][0]
+
+# Shared by Radar and Analytics: kept until the data version changes, so it refreshes after loads.
+population_cache = VersionedCache(ttl=float(os.getenv("POPULATION_CACHE_TTL_SECONDS", 30)))
+
+async def patient_count(exact=False):
+    entry, _ = await population_cache.get(exact, data_version, lambda: count_patients(exact))
+    return entry.value
+
+@app.get("/api/population")
+async def get_population(exact: bool = False):
+    """Number of distinct patients; approximate (within ~1%) unless exact=true."""
+    try:
+        count = await patient_count(exact) if clickhouse_pool else 0
+        return {"patients": count, "exact": exact}
+    except Exception as e:
+        logging.error(f"Error in population endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ========== RADAR MODE ENDPOINT ==========
+# Radar counts come from a rolling window kept in memory and fed only with
+# encounters newer than the last one counted (see radar.RollingWindowCounts).
+RADAR_WINDOW_DAYS = float(os.getenv("RADAR_WINDOW_DAYS", 7))
+
+RADAR_DELTA_QUERY = f"""
+SELECT toStartOfHour(encounter_date) as hour, chief_complaint, encounter_type, count(), max(encounter_date)
+FROM {ENCOUNTERS_TABLE}
+WHERE encounter_date > %(since)s AND encounter_date <= %(until)s
+GROUP BY hour, chief_complaint, encounter_type
+"""
+
+RADAR_STATE_QUERY = f"""
+SELECT sum(rows), now(), (SELECT count() FROM {ENCOUNTERS_TABLE} WHERE encounter_date > now())
+FROM system.parts
+WHERE database = currentDatabase() AND table = '{ENCOUNTERS_TABLE}' AND active
+"""
+
+async def radar_delta(since, until):
+    return await ch_execute(RADAR_DELTA_QUERY, {"since": since, "until": until})
+
+async def radar_state():
+    return (await ch_execute(RADAR_STATE_QUERY))[0]
+
+radar_window = RollingWindowCounts(radar_delta, radar_state, window=timedelta(days=RADAR_WINDOW_DAYS))
+
+# Daily counts for every chief complaint, encounter type and condition over the
+# history window, one row per series with its days grouped into arrays, scored
+# by anomaly.detect_anomalies. The last complete day (yesterday) is evaluated;
+# a partial today would read as a drop. In the normalized layout the
+# `patients` view would join all of patient_dim FINAL on every scan, so the
+# complaint and type series read encounters alone and the condition series
+# join per-patient daily counts to just the ids and conditions of patient_dim
+# (FINAL, so a patient reloaded since the last merge is counted once).
+ANOMALY_HISTORY_DAYS = int(os.getenv("ANOMALY_HISTORY_DAYS", 56))
+ANOMALY_MAX_ALERTS = int(os.getenv("ANOMALY_MAX_ALERTS", 10))
+
+ANOMALY_SERIES_QUERY = """
+SELECT dimension, value, groupArray(age), groupArray(encounters), today() - 1
+FROM (
+    SELECT series.1 as dimension, series.2 as value,
+    dateDiff('day', toDate(encounter_date), today() - 1) as age, count() as encounters
+    FROM encounters
+    ARRAY JOIN [('chief_complaint', toString(chief_complaint)), ('encounter_type', toString(encounter_type))] as series
+    WHERE encounter_date >= today() - %(days)s AND encounter_date < today()
+    GROUP BY dimension, value, age
+    UNION ALL
+    SELECT 'condition' as dimension, toString(condition) as value, age, sum(patient_encounters) as encounters
+    FROM (
+        SELECT e.age as age, e.patient_encounters as patient_encounters, p.conditions as conditions
+        FROM (
+            SELECT patient_id, dateDiff('day', toDate(encounter_date), today() - 1) as age,
+            count() as patient_encounters
+            FROM encounters
+            WHERE encounter_date >= today() - %(days)s AND encounter_date < today()
+            GROUP BY patient_id, age
+        ) AS e
+        INNER JOIN (SELECT patient_id, conditions FROM patient_dim FINAL WHERE notEmpty(conditions)) AS p USING (patient_id)
+    )
+    ARRAY JOIN conditions as condition
+    GROUP BY dimension, value, age
+)
+WHERE value != ''
+GROUP BY dimension, value
+""" if NORMALIZED else """
+SELECT dimension, value, groupArray(age), groupArray(encounters), today() - 1
+FROM (
+    SELECT series.1 as dimension, series.2 as value,
+    dateDiff('day', toDate(encounter_date), today() - 1) as age, count() as encounters
+    FROM patients
+    ARRAY JOIN arrayConcat(
+        [('chief_complaint', toString(chief_complaint)), ('encounter_type', toString(encounter_type))],
+        arrayMap(c -> ('condition', toString(c)), conditions)
+    ) as series
+    WHERE encounter_date >= today() - %(days)s AND encounter_date < today()
+    GROUP BY dimension, value, age
+)
+WHERE value != ''
+GROUP BY dimension, value
+"""
+
+async def find_anomalies():
+    """Returns (anomalies, number of series scanned)."""
+    columns = await ch_execute(ANOMALY_SERIES_QUERY, {"days": ANOMALY_HISTORY_DAYS + 1}, columnar=True)
+    if not columns or not len(columns[0]):
+        return [], 0
+    dimensions, values, day_ages, day_counts, end_days = columns
+    anomalies = detect_anomalies(
+        dimensions, values, day_ages, day_counts, end_days[0],
+        history_days=ANOMALY_HISTORY_DAYS,
+        alpha=float(os.getenv("ANOMALY_EWMA_ALPHA", 0.3)),
+        false_alarm_rate=float(os.getenv("ANOMALY_FALSE_ALARM_RATE", 0.05)),
+        z_medium=float(os.getenv("ANOMALY_Z_MEDIUM", 3.0)),
+        z_high=float(os.getenv("ANOMALY_Z_HIGH", 4.0)),
+        min_count=int(os.getenv("ANOMALY_MIN_COUNT", 5)),
+        limit=ANOMALY_MAX_ALERTS
+    )
+    return anomalies, len(dimensions)
+
+# Alert wording from previous scans: detection key -> (detection, alert, first seen).
+# Detections whose inputs have not changed keep their wording, so the LLM is
+# only asked about new or changed detections and unchanged alerts stay
+# byte-identical for the stream diff.
+radar_alert_wording = {}
+
+async def word_alerts(detections):
+    """Asks the LLM to word one alert per detection. Returns {detection key: alert fields}."""
+    alert_analysis_response = await chat_completion(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "system",
+                "content": """Convert detection results into clinical alerts. Return ONLY valid JSON.
+                
+                EXACT format required:
                 {
-                    "role": "system",
-                    "content": """Convert detection results into clinical alerts. Return ONLY valid JSON.
-                    
-                    EXACT format required:
+                  "alerts": [
                     {
-                      "alerts": [
-                        {
-                          "severity": "high",
-                          "emoji": "🚨",
-                          "title": "Alert Title",
-                          "metric": "Description with numbers",
-                          "action": "Recommended action"
-                        }
-                      ]
+                      "key": "key of the detection",
+                      "severity": "high",
+                      "emoji": "🚨",
+                      "title": "Alert Title",
+                      "metric": "Description with numbers",
+                      "action": "Recommended action"
                     }
-                    
-                    The alerts array MUST contain objects with these exact keys. Do not return strings."""
-                },
-                {
-                    "role": "user",
-                    "content": f"Create alerts from: {json.dumps(raw_alerts)}"
+                  ]
                 }
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        ai_response = json.loads(alert_analysis_response.choices[0].message.content)
-        alerts = ai_response.get("alerts", [])
-        
-        if not isinstance(alerts, list):
-            alerts = []
-        else:
-            alerts = [a for a in alerts if isinstance(a, dict)]
-        
-        for i, alert in enumerate(alerts):
-            alert["id"] = i + 1
-            alert["timestamp"] = f"{i * 5} min ago"
-            if "change" not in alert:
-                alert["change"] = f"+{20 + i * 10}%"
-        
-        return {
-            "alerts": alerts,
-            "lastScan": "2025-10-04T10:30:00Z",
-            "metrics": {
-                "activeAlerts": len(alerts),
-                "patientsMonitored": clickhouse_client.execute("SELECT COUNT(DISTINCT patient_id) FROM patients")[0][0] if clickhouse_client else 0,
-                "avgResponseTime": 450
+                
+                The alerts array MUST contain objects with these exact keys. Do not return strings.
+                Create exactly one alert per detection and copy the detection's "key" value into its "key"."""
+            },
+            {
+                "role": "user",
+                "content": f"Create alerts from: {json_dumps(detections)}"
             }
+        ],
+        response_format={"type": "json_object"}
+    )
+    
+    ai_response = json_loads(alert_analysis_response.choices[0].message.content)
+    alerts = ai_response.get("alerts", [])
+    if not isinstance(alerts, list):
+        return {}
+    
+    keys = {detection["key"] for detection in detections}
+    worded = {}
+    for alert in alerts:
+        if isinstance(alert, dict) and alert.get("key") in keys and alert["key"] not in worded:
+            worded[alert["key"]] = alert
+    return worded
+
+async def run_radar_scan():
+    """One Radar detection pass: window counts and statistical anomalies, worded into alerts by the LLM."""
+    raw_alerts = []
+    anomalies, series_scanned = [], 0
+    if clickhouse_pool:
+        try:
+            await radar_window.refresh()
+            detections = [
+                ("recent_complaints", f"Top chief complaints in last {RADAR_WINDOW_DAYS:g} days", radar_window.complaint_counts()),
+                ("encounter_types", f"Encounter type distribution in last {RADAR_WINDOW_DAYS:g} days", radar_window.encounter_type_counts())
+            ]
+            for detection_type, description, counts in detections:
+                raw_alerts.append({
+                    "type": detection_type,
+                    "description": description,
+                    "result": list(counts[0]) if counts else None
+                })
+        except Exception as e:
+            print(f"Radar window refresh failed: {e}")
+        
+        try:
+            anomalies, series_scanned = await find_anomalies()
+            for anomaly in anomalies:
+                raw_alerts.append({
+                    "type": "anomaly",
+                    "series": anomaly["series"],
+                    "description": f"{anomaly['dimension']} '{anomaly['value']}' on {anomaly['day']}: "
+                                   f"{anomaly['current']} encounters vs {anomaly['expected']} expected",
+                    "result": anomaly
+                })
+        except Exception as e:
+            print(f"Anomaly detection failed: {e}")
+    
+    if not raw_alerts:
+        raw_alerts = [
+            {"type": "chest_pain", "description": "Recent chest pain cases", "result": ["Chest pain", 15]},
+            {"type": "er_visits", "description": "ER visit distribution", "result": ["ED", 89]}
+        ]
+    # Every detection carries the stable key its alert is published under.
+    for detection in raw_alerts:
+        detection["key"] = detection.get("series", detection["type"])
+    
+    # Only new or changed detections are sent to the LLM; the rest keep their wording.
+    stale = [d for d in raw_alerts if radar_alert_wording.get(d["key"], (None,))[0] != d]
+    if stale:
+        worded = await word_alerts(stale)
+        now = time.strftime("%H:%M UTC", time.gmtime())
+        for detection in stale:
+            if detection["key"] in worded:
+                previous = radar_alert_wording.get(detection["key"])
+                first_seen = previous[2] if previous else now
+                radar_alert_wording[detection["key"]] = (detection, worded[detection["key"]], first_seen)
+    current_keys = {d["key"] for d in raw_alerts}
+    for key in [key for key in radar_alert_wording if key not in current_keys]:
+        del radar_alert_wording[key]
+    
+    patients_monitored = 0
+    if clickhouse_pool:
+        try:
+            patients_monitored = await patient_count()
+        except Exception as e:
+            print(f"Population count failed: {e}")
+            previous = radar_scanner.snapshot
+            patients_monitored = previous["metrics"]["patientsMonitored"] if previous else 0
+    
+    anomalies_by_series = {anomaly["series"]: anomaly for anomaly in anomalies}
+    alerts = []
+    for detection in raw_alerts:
+        entry = radar_alert_wording.get(detection["key"])
+        if entry is None or entry[0] != detection:
+            # The LLM did not word this detection; try again next scan.
+            continue
+        alert = {**entry[1], "id": detection["key"], "key": detection["key"], "timestamp": f"Since {entry[2]}"}
+        anomaly = anomalies_by_series.get(detection.get("series"))
+        if anomaly is not None:
+            # Severity and change are the detector's numbers, not the model's.
+            alert["severity"] = anomaly["severity"]
+            alert["change"] = anomaly["change"]
+            alert["zScore"] = anomaly["zScore"]
+        alerts.append(alert)
+    
+    return {
+        "alerts": alerts,
+        "metrics": {
+            "activeAlerts": len(alerts),
+            "seriesScanned": series_scanned,
+            "patientsMonitored": patients_monitored,
+            "avgResponseTime": 450
         }
+    }
+
+radar_scanner = RadarScanner(run_radar_scan, interval=float(os.getenv("RADAR_SCAN_INTERVAL_SECONDS", 60)))
+alert_broadcaster = AlertBroadcaster(queue_size=int(os.getenv("ALERT_STREAM_QUEUE_SIZE", 16)))
+radar_scanner.add_listener(alert_broadcaster.on_scan)
+
+@app.on_event("startup")
+async def start_radar_scanner():
+    if os.getenv("RADAR_SCANNER_ENABLED", "true").lower() == "true":
+        radar_scanner.start()
+
+@app.on_event("shutdown")
+async def stop_radar_scanner():
+    try:
+        await radar_scanner.stop()
+    finally:
+        close_clickhouse_pool()
+
+@app.get("/api/alerts")
+async def get_alerts():
+    """Serves the latest Radar snapshot, from the background scanner or rescanned on demand when it is disabled."""
+    try:
+        return FastJSONResponse(await radar_scanner.get_snapshot())
         
     except Exception as e:
         print(f"Error in alerts endpoint: {str(e)}")
@@ -337,139 +780,327 @@ async def get_alerts():
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/alerts/stream")
+async def stream_alerts(request: Request):
+    """Server-Sent Events: a full snapshot on connect, then only new/changed alerts after each scan."""
+    subscription = alert_broadcaster.subscribe()
+    
+    async def events():
+        try:
+            snapshot = await radar_scanner.get_snapshot()
+            yield format_sse("snapshot", snapshot, snapshot["version"])
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(subscription.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream.
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event, data, data["version"])
+        except Exception as e:
+            logging.error(f"Error in alerts stream: {str(e)}")
+            yield format_sse("error", {"detail": str(e)})
+        finally:
+            alert_broadcaster.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ========== PATIENT DETAIL ENDPOINT ==========
+# Profiles are reused until the patient's encounter history (i.e. the prompt) changes.
+profile_cache = ProfileCache(
+    max_bytes=int(os.getenv("PROFILE_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    db_path=os.getenv("PROFILE_CACHE_DB_PATH")
+)
+
+@app.on_event("shutdown")
+def close_profile_cache():
+    profile_cache.close()
+
+PATIENT_COLUMNS = ["patient_id", "age", "conditions", "last_a1c_date", "encounter_date", "chief_complaint", "encounter_type"]
+
+# Parameters are escaped by the driver; never interpolate patient_id into the SQL.
+PATIENT_BATCH_QUERY = f"""
+SELECT {', '.join(PATIENT_COLUMNS)} FROM patients
+WHERE patient_id IN %(patient_ids)s
+ORDER BY patient_id, encounter_date DESC
+"""
+
+# Normalized layout: patient attributes are read once per patient instead of once per encounter.
+PATIENT_DIM_QUERY = """
+SELECT patient_id, age, conditions, last_a1c_date FROM patient_dim FINAL
+WHERE patient_id IN %(patient_ids)s
+"""
+
+ENCOUNTERS_QUERY = """
+SELECT patient_id, encounter_date, chief_complaint, encounter_type FROM encounters
+WHERE patient_id IN %(patient_ids)s
+ORDER BY patient_id, encounter_date DESC
+"""
+
+async def fetch_patient_rows(patient_ids):
+    """Returns {patient_id: encounter rows (newest first) in PATIENT_COLUMNS order} for either table layout."""
+    params = {"patient_ids": tuple(patient_ids)}
+    rows_by_patient = {}
+    if NORMALIZED:
+        dimension, encounters = await asyncio.gather(
+            ch_execute(PATIENT_DIM_QUERY, params),
+            ch_execute(ENCOUNTERS_QUERY, params)
+        )
+        attributes = {row[0]: row[1:] for row in dimension}
+        for patient_id, encounter_date, chief_complaint, encounter_type in encounters:
+            age, conditions, last_a1c_date = attributes.get(patient_id, (None, [], None))
+            rows_by_patient.setdefault(patient_id, []).append(
+                (patient_id, age, conditions, last_a1c_date, encounter_date, chief_complaint, encounter_type)
+            )
+    else:
+        for row in await ch_execute(PATIENT_BATCH_QUERY, params):
+            rows_by_patient.setdefault(row[0], []).append(row)
+    return rows_by_patient
+
+async def generate_patient_profile(patient_data):
+    """Returns the AI profile for a patient, calling gpt-4o only when the encounter history changed."""
+    prompt = f"Generate patient profile for: {json_dumps(patient_data)}"
+    fingerprint = profile_fingerprint(prompt)
+    cached = await run_db(profile_cache.get, patient_data["id"], fingerprint)
+    if cached is not None:
+        return cached
+    
+    profile_response = await chat_completion(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "system",
+                "content": """Generate a patient profile. Return JSON with: name, gender, dob, riskScore (0-100), careGaps array, timeline array, aiSummary."""
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        response_format={"type": "json_object"}
+    )
+    
+    ai_profile = json_loads(profile_response.choices[0].message.content)
+    await run_db(profile_cache.put, patient_data["id"], fingerprint, ai_profile)
+    return ai_profile
+
+def build_patient_data(patient_id, columns, rows):
+    """Shapes one patient's encounter rows (newest first) into the data sent to the profile model."""
+    if not rows:
+        return {
+            "id": patient_id,
+            "age": 67,
+            "conditions": ["Type 2 Diabetes", "Hypertension"],
+            "all_encounters": []
+        }
+    
+    all_encounters = []
+    for row in rows:
+        encounter = {}
+        for i, col in enumerate(columns):
+            encounter[col] = row[i]
+        all_encounters.append(encounter)
+    
+    latest = all_encounters[0]
+    return {
+        "id": latest.get("patient_id"),
+        "age": latest.get("age"),
+        "conditions": latest.get("conditions", []),
+        "last_a1c_date": str(latest.get("last_a1c_date", "")),
+        "all_encounters": all_encounters
+    }
+
+def format_patient(patient_id, patient_data, ai_profile):
+    return {
+        "id": patient_data["id"],
+        "name": ai_profile.get("name", "Unknown Patient"),
+        "age": patient_data["age"],
+        "mrn": f"MRN-{patient_id[1:]}56" if patient_id.startswith('P') else f"MRN-{patient_id}",
+        "gender": ai_profile.get("gender", "Unknown"),
+        "dob": ai_profile.get("dob", "Unknown"),
+        "phone": "(555) 123-4567",
+        "email": f"{ai_profile.get('name', 'patient').lower().replace(' ', '.')}@email.com",
+        "address": "123 Main St, New York, NY 10001",
+        "primaryCare": "Dr. James Wilson",
+        "riskScore": ai_profile.get("riskScore", 50),
+        "conditions": patient_data.get("conditions", []),
+        "allergies": ["Penicillin"],
+        "careGaps": ai_profile.get("careGaps", []),
+        "timeline": ai_profile.get("timeline", []),
+        "aiSummary": ai_profile.get("aiSummary", "Patient data under review.")
+    }
+
 @app.get("/api/patient/{patient_id}")
 async def get_patient_detail(patient_id: str):
     try:
-        if clickhouse_client:
-            patient_query = f"SELECT * FROM patients WHERE patient_id = '{patient_id}' ORDER BY encounter_date DESC"
-            result = clickhouse_client.execute(patient_query, with_column_types=True)
-            
-            if result[0]:
-                columns = [col[0] for col in result[1]]
-                all_encounters = []
-                for row in result[0]:
-                    encounter = {}
-                    for i, col in enumerate(columns):
-                        encounter[col] = row[i]
-                    all_encounters.append(encounter)
-                
-                latest = all_encounters[0]
-                patient_data = {
-                    "id": latest.get("patient_id"),
-                    "age": latest.get("age"),
-                    "conditions": latest.get("conditions", []),
-                    "last_a1c_date": str(latest.get("last_a1c_date", "")),
-                    "all_encounters": all_encounters
-                }
-            else:
-                patient_data = None
-        else:
-            patient_data = None
+        rows = []
+        if clickhouse_pool:
+            rows = (await fetch_patient_rows([patient_id])).get(patient_id, [])
         
-        if not patient_data:
-            patient_data = {
-                "id": patient_id,
-                "age": 67,
-                "conditions": ["Type 2 Diabetes", "Hypertension"],
-                "all_encounters": []
-            }
+        patient_data = build_patient_data(patient_id, PATIENT_COLUMNS, rows)
+        ai_profile = await generate_patient_profile(patient_data)
         
-        profile_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """Generate a patient profile. Return JSON with: name, gender, dob, riskScore (0-100), careGaps array, timeline array, aiSummary."""
-                },
-                {
-                    "role": "user",
-                    "content": f"Generate patient profile for: {json.dumps(patient_data)}"
-                }
-            ],
-            response_format={"type": "json_object"}
-        )
+        return FastJSONResponse(format_patient(patient_id, patient_data, ai_profile))
         
-        ai_profile = json.loads(profile_response.choices[0].message.content)
+    except Exception as e:
+       logging.error(f"Error in patient detail endpoint: {str(e)}")
+       raise HTTPException(status_code=500, detail=str(e))
+
+PROFILE_PREFETCH_CONCURRENCY = int(os.getenv("PROFILE_PREFETCH_CONCURRENCY", 4))
+
+class PatientBatchRequest(BaseModel):
+    patient_ids: List[str] = Field(..., min_length=1, max_length=100)
+
+@app.post("/api/patients/batch")
+async def get_patients_batch(request: PatientBatchRequest):
+    """Fetches many patients in one query and warms their profiles with bounded parallelism.
+
+    Used by Query Mode to prefetch the detail pages of a result set. A failed
+    profile for one patient is reported under "errors" instead of failing the batch.
+    """
+    try:
+        patient_ids = list(dict.fromkeys(request.patient_ids))
+        rows_by_patient = {}
+        if clickhouse_pool:
+            rows_by_patient = await fetch_patient_rows(patient_ids)
         
-        full_patient = {
-            "id": patient_data["id"],
-            "name": ai_profile.get("name", "Unknown Patient"),
-            "age": patient_data["age"],
-            "mrn": f"MRN-{patient_id[1:]}56" if patient_id.startswith('P') else f"MRN-{patient_id}",
-            "gender": ai_profile.get("gender", "Unknown"),
-            "dob": ai_profile.get("dob", "Unknown"),
-            "phone": "(555) 123-4567",
-            "email": f"{ai_profile.get('name', 'patient').lower().replace(' ', '.')}@email.com",
-            "address": "123 Main St, New York, NY 10001",
-            "primaryCare": "Dr. James Wilson",
-            "riskScore": ai_profile.get("riskScore", 50),
-            "conditions": patient_data.get("conditions", []),
-            "allergies": ["Penicillin"],
-            "careGaps": ai_profile.get("careGaps", []),
-            "timeline": ai_profile.get("timeline", []),
-            "aiSummary": ai_profile.get("aiSummary", "Patient data under review.")
-        }
+        semaphore = asyncio.Semaphore(PROFILE_PREFETCH_CONCURRENCY)
+        
+        async def load_patient(patient_id):
+            patient_data = build_patient_data(patient_id, PATIENT_COLUMNS, rows_by_patient.get(patient_id, []))
+            async with semaphore:
+                ai_profile = await generate_patient_profile(patient_data)
+            return format_patient(patient_id, patient_data, ai_profile)
+        
+        results = await asyncio.gather(*(load_patient(pid) for pid in patient_ids), return_exceptions=True)
+        
+        patients, errors = [], {}
+        for patient_id, result in zip(patient_ids, results):
+            if isinstance(result, Exception):
+                logging.error(f"Error loading patient {patient_id} in batch: {str(result)}")
+                errors[patient_id] = str(result)
+            else:
+                patients.append(result)
         
-        return full_patient
+        return FastJSONResponse({"patients": patients, "errors": errors})
         
     except Exception as e:
-       logging.error(f"Error in patient detail endpoint: {str(e)}")
-       raise HTTPException(status_code=500, detail=str(e))
+        logging.error(f"Error in patient batch endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 # ========== ANALYTICS ENDPOINT ==========
+# totalPatients comes from the shared population cache (patient_count).
+ANALYTICS_QUERIES = {
+    "volumeData": f"""
+    SELECT toStartOfWeek(encounter_date) as week, COUNT(*) as encounters,
+    COUNT(DISTINCT CASE WHEN encounter_type = 'Inpatient' THEN patient_id END) as admissions
+    FROM {ENCOUNTERS_TABLE} WHERE encounter_date >= now() - INTERVAL 8 WEEK
+    GROUP BY week ORDER BY week
+    """,
+    "conditionsData": """
+    SELECT arrayJoin(conditions) as condition, count() as count
+    FROM patient_dim FINAL GROUP BY condition ORDER BY count DESC LIMIT 5
+    """ if NORMALIZED else """
+    SELECT arrayJoin(conditions) as condition, COUNT(DISTINCT patient_id) as count
+    FROM patients GROUP BY condition ORDER BY count DESC LIMIT 5
+    """,
+    "encounterTypesData": f"SELECT encounter_type, COUNT(*) as count FROM {ENCOUNTERS_TABLE} GROUP BY encounter_type",
+    "complaintsData": f"""
+    SELECT chief_complaint, COUNT(*) as count FROM {ENCOUNTERS_TABLE} 
+    WHERE chief_complaint != '' GROUP BY chief_complaint ORDER BY count DESC LIMIT 10
+    """
+}
+
+# Reads from the AggregatingMergeTree rollups maintained by materialized views
+# (see scripts/setup_database.py), so cost no longer grows with encounter history.
+ANALYTICS_ROLLUP_QUERIES = {
+    "volumeData": """
+    SELECT week, sum(encounters) as encounters,
+    uniqMergeIf(patients, encounter_type = 'Inpatient') as admissions
+    FROM analytics_weekly WHERE week >= toStartOfWeek(now() - INTERVAL 8 WEEK)
+    GROUP BY week ORDER BY week
+    """,
+    "conditionsData": """
+    SELECT condition, uniqMerge(patients) as count
+    FROM analytics_conditions GROUP BY condition ORDER BY count DESC LIMIT 5
+    """,
+    "encounterTypesData": "SELECT encounter_type, sum(encounters) as count FROM analytics_weekly GROUP BY encounter_type",
+    "complaintsData": """
+    SELECT chief_complaint, sum(encounters) as count FROM analytics_complaints
+    WHERE chief_complaint != '' GROUP BY chief_complaint ORDER BY count DESC LIMIT 10
+    """
+}
+
+ANALYTICS_USE_ROLLUPS = os.getenv("ANALYTICS_USE_ROLLUPS", "true").lower() == "true"
+
+async def timed_query(name, sql):
+    """Runs one analytics sub-query and reports how long it took in milliseconds."""
+    start_time = time.time()
+    rows = await ch_execute(sql)
+    return name, rows, round((time.time() - start_time) * 1000, 1)
+
+async def timed_population(exact):
+    start_time = time.time()
+    count = await patient_count(exact)
+    return "totalPatients", [(count,)], round((time.time() - start_time) * 1000, 1)
+
+analytics_cache = ResponseCache(ttl=float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", 30)))
+
+async def compute_analytics(exact=False):
+    # Each sub-query gets its own pooled connection, so latency is max() rather than sum().
+    start_time = time.time()
+    queries = {**ANALYTICS_QUERIES, **ANALYTICS_ROLLUP_QUERIES} if ANALYTICS_USE_ROLLUPS else ANALYTICS_QUERIES
+    results = await asyncio.gather(
+        timed_population(exact),
+        *(timed_query(name, sql) for name, sql in queries.items())
+    )
+    data = {name: rows for name, rows, _ in results}
+    timings = {name: elapsed for name, _, elapsed in results}
+    timings["total"] = round((time.time() - start_time) * 1000, 1)
+    
+    volume_formatted = [{"date": f"Week {i+1}", "encounters": row[1], "admissions": row[2]} 
+                      for i, row in enumerate(data["volumeData"])]
+    conditions_formatted = [{"condition": row[0], "count": row[1], "change": 0} 
+                           for row in data["conditionsData"]]
+    encounter_types_formatted = [{"name": row[0], "value": row[1]} 
+                                for row in data["encounterTypesData"]]
+    complaints_formatted = [{"complaint": row[0], "count": row[1]} 
+                           for row in data["complaintsData"]]
+    
+    return {
+        "totalPatients": data["totalPatients"][0][0],
+        "volumeData": volume_formatted,
+        "conditionsData": conditions_formatted,
+        "encounterTypesData": encounter_types_formatted,
+        "complaintsData": complaints_formatted,
+        "timings": timings
+    }
+
 @app.get("/api/analytics")
-async def get_analytics():
+async def get_analytics(request: Request, exact: bool = False):
+    """Dashboard aggregates; exact=true counts totalPatients exactly instead of from the HyperLogLog rollup."""
     try:
-        if clickhouse_client:
-            total_patients = clickhouse_client.execute("SELECT COUNT(DISTINCT patient_id) FROM patients")[0][0]
-            
-            volume_query = """
-            SELECT toStartOfWeek(encounter_date) as week, COUNT(*) as encounters,
-            COUNT(DISTINCT CASE WHEN encounter_type = 'Inpatient' THEN patient_id END) as admissions
-            FROM patients WHERE encounter_date >= now() - INTERVAL 8 WEEK
-            GROUP BY week ORDER BY week
-            """
-            volume_data = clickhouse_client.execute(volume_query)
-            
-            conditions_query = """
-            SELECT arrayJoin(conditions) as condition, COUNT(DISTINCT patient_id) as count
-            FROM patients GROUP BY condition ORDER BY count DESC LIMIT 5
-            """
-            conditions_data = clickhouse_client.execute(conditions_query)
-            
-            encounter_types_query = "SELECT encounter_type, COUNT(*) as count FROM patients GROUP BY encounter_type"
-            encounter_types_data = clickhouse_client.execute(encounter_types_query)
-            
-            complaints_query = """
-            SELECT chief_complaint, COUNT(*) as count FROM patients 
-            WHERE chief_complaint != '' GROUP BY chief_complaint ORDER BY count DESC LIMIT 10
-            """
-            complaints_data = clickhouse_client.execute(complaints_query)
-            
-            volume_formatted = [{"date": f"Week {i+1}", "encounters": row[1], "admissions": row[2]} 
-                              for i, row in enumerate(volume_data)]
-            conditions_formatted = [{"condition": row[0], "count": row[1], "change": 0} 
-                                   for row in conditions_data]
-            encounter_types_formatted = [{"name": row[0], "value": row[1]} 
-                                        for row in encounter_types_data]
-            complaints_formatted = [{"complaint": row[0], "count": row[1]} 
-                                   for row in complaints_data]
-            
-            return {
-                "totalPatients": total_patients,
-                "volumeData": volume_formatted,
-                "conditionsData": conditions_formatted,
-                "encounterTypesData": encounter_types_formatted,
-                "complaintsData": complaints_formatted
-            }
+        if clickhouse_pool:
+            # Concurrent refreshes share one computation; unchanged data is answered with 304.
+            entry, cache_status = await analytics_cache.get(
+                "analytics:exact" if exact else "analytics", data_version, lambda: compute_analytics(exact)
+            )
+            headers = {"ETag": entry.etag, "Cache-Control": "no-cache", "X-Cache": cache_status.upper()}
+            if etag_matches(request.headers.get("if-none-match"), entry.etag):
+                return Response(status_code=304, headers=headers)
+            return Response(content=entry.body, media_type="application/json", headers=headers)
         else:
             return {
                 "totalPatients": 0,
                 "volumeData": [],
                 "conditionsData": [],
                 "encounterTypesData": [],
-                "complaintsData": []
+                "complaintsData": [],
+                "timings": {}
             }
         
     except Exception as e:
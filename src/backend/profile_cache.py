@@ -0,0 +1,99 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+def profile_fingerprint(prompt):
+    """Hashes exactly what was sent to the model, so any change to the encounter history is a miss."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class ProfileCache:
+    """Cache of AI-generated patient profiles keyed by patient_id + encounter-history fingerprint.
+
+    Profiles live in an in-memory LRU bounded by total encoded size. With a
+    `db_path`, they are also written to a local SQLite file so they survive
+    restarts and can be shared by workers on the same host. Only the latest
+    fingerprint per patient is kept: once a patient has a new encounter the old
+    profile can never be served again.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, db_path=None):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # patient_id -> (fingerprint, encoded profile, size in bytes)
+        self._lock = threading.Lock()
+        self._db = None
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS patient_profiles ("
+                "patient_id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, profile TEXT NOT NULL, "
+                "updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+            )
+            self._db.commit()
+
+    def get(self, patient_id, fingerprint):
+        """Returns the cached profile dict, or None. May hit SQLite, so call it off the event loop."""
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is not None and entry[0] == fingerprint:
+                self._entries.move_to_end(patient_id)
+                self._stats["hits"] += 1
+                return json.loads(entry[1])
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT profile FROM patient_profiles WHERE patient_id = ? AND fingerprint = ?",
+                    (patient_id, fingerprint)
+                ).fetchone()
+                if row is not None:
+                    self._remember(patient_id, fingerprint, row[0])
+                    self._stats["disk_hits"] += 1
+                    return json.loads(row[0])
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, patient_id, fingerprint, profile):
+        encoded = json.dumps(profile, separators=(",", ":"))
+        with self._lock:
+            self._remember(patient_id, fingerprint, encoded)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO patient_profiles (patient_id, fingerprint, profile) VALUES (?, ?, ?)",
+                        (patient_id, fingerprint, encoded)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logging.warning(f"Could not persist profile for {patient_id}: {str(e)}")
+
+    def _remember(self, patient_id, fingerprint, encoded):
+        """Adds an entry to the in-memory LRU and evicts by size. Caller holds the lock."""
+        previous = self._entries.pop(patient_id, None)
+        if previous is not None:
+            self.current_bytes -= previous[2]
+        size = len(encoded.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._entries[patient_id] = (fingerprint, encoded, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self._stats["evictions"] += 1
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self.current_bytes}
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+
+class RadarScanner:
+    """Runs the Radar detection pass on a fixed cadence and keeps the latest alert snapshot in memory.
+
+    `scan_fn` is an async callable returning a dict with "alerts" and
+    "metrics"; the scanner stamps each result with a version and the real scan
+    time. Viewers read the snapshot, so detection cost is per scan rather than
+    per open browser tab.
+    """
+
+    def __init__(self, scan_fn, interval=60):
+        self.scan_fn = scan_fn
+        self.interval = interval
+        self.snapshot = None
+        self.version = 0
+        self.last_error = None
+        self._scanned_at = None
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Registers an async callback invoked with (snapshot, previous_snapshot) after every scan."""
+        self._listeners.append(callback)
+
+    async def scan_now(self):
+        """Runs one scan, unless another one is already in flight, and returns the resulting snapshot."""
+        version_before = self.version
+        async with self._lock:
+            if self.version != version_before and self.snapshot is not None:
+                # A concurrent caller just finished a scan; reuse it.
+                return self.snapshot
+            start_time = time.time()
+            result = await self.scan_fn()
+            previous = self.snapshot
+            self.version += 1
+            self.snapshot = {
+                **result,
+                "version": self.version,
+                "lastScan": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                "scanDuration": round((time.time() - start_time) * 1000)
+            }
+            self.last_error = None
+            self._scanned_at = time.monotonic()
+            for callback in self._listeners:
+                try:
+                    await callback(self.snapshot, previous)
+                except Exception as e:
+                    logging.error(f"Radar scan listener failed: {str(e)}")
+            return self.snapshot
+
+    async def get_snapshot(self):
+        """Returns the latest snapshot, scanning synchronously if none exists yet.
+
+        Without the background task (see start) a snapshot older than
+        `interval` is rescanned on demand; if that scan fails, the previous
+        snapshot is served.
+        """
+        if self.snapshot is None:
+            return await self.scan_now()
+        if self._task is None and time.monotonic() - self._scanned_at >= self.interval:
+            try:
+                return await self.scan_now()
+            except Exception as e:
+                self.last_error = str(e)
+                logging.error(f"Radar scan failed: {str(e)}")
+        return self.snapshot
+
+    async def _run(self):
+        while True:
+            try:
+                await self.scan_now()
+                logging.info(f"Radar scan v{self.version} completed: {len(self.snapshot.get('alerts', []))} alerts")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep serving the previous snapshot; try again next cycle.
+                self.last_error = str(e)
+                logging.error(f"Radar scan failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class RollingWindowCounts:
+    """Encounter counts per (chief_complaint, encounter_type) over a rolling window, maintained incrementally.
+
+    Counts are kept in hourly buckets. Each refresh asks `delta_fn(since, until)`
+    only for encounters after the watermark (the latest encounter_date already
+    counted) and no later than the server's now, adds them to their buckets and
+    drops buckets that have left the window, so a scan costs in proportion to
+    new data rather than window size. Future-dated encounters (scheduled
+    visits) are counted once now reaches them, so they never move the
+    watermark ahead of present-dated rows.
+
+    `state_fn()` returns (total rows in the source table, server now(), rows
+    dated after that now). If the total grew by anything other than the delta
+    just counted plus the change in future-dated rows -- rows loaded with
+    older encounter dates, deletions, a reload -- the window is rebuilt from
+    scratch. The oldest bucket is counted whole, so the window edge is
+    accurate to the hour.
+    """
+
+    def __init__(self, delta_fn, state_fn, window=timedelta(days=7)):
+        self.delta_fn = delta_fn
+        self.state_fn = state_fn
+        self.window = window
+        self.watermark = None
+        self.total_rows = None
+        self.future_rows = None
+        self.now = None
+        self._buckets = {}  # hour -> Counter{(chief_complaint, encounter_type): count}
+        self._stats = {"incremental": 0, "rebuilds": 0, "delta_rows": 0}
+
+    async def refresh(self):
+        total_rows, now, future_rows = await self.state_fn()
+        window_start = now - self.window
+        if self.watermark is not None:
+            buckets, watermark, counted = self._collect(await self.delta_fn(self.watermark, now))
+            if total_rows - self.total_rows == counted + future_rows - self.future_rows:
+                for hour, counts in buckets.items():
+                    self._buckets.setdefault(hour, Counter()).update(counts)
+                self.watermark = max(self.watermark, watermark or self.watermark)
+                self._stats["incremental"] += 1
+                self._stats["delta_rows"] += counted
+                self._finish(total_rows, now, future_rows, window_start)
+                return
+            logging.info(f"Radar window: {total_rows - self.total_rows} new rows but {counted} past the watermark; rebuilding")
+
+        self._buckets, self.watermark, _ = self._collect(await self.delta_fn(window_start, now))
+        self.watermark = self.watermark or window_start
+        self._stats["rebuilds"] += 1
+        self._finish(total_rows, now, future_rows, window_start)
+
+    @staticmethod
+    def _collect(rows):
+        """Groups delta rows (hour, chief_complaint, encounter_type, count, max encounter_date) into buckets."""
+        buckets, watermark, counted = {}, None, 0
+        for hour, chief_complaint, encounter_type, count, latest in rows:
+            buckets.setdefault(hour, Counter())[(chief_complaint, encounter_type)] += count
+            counted += count
+            if watermark is None or latest > watermark:
+                watermark = latest
+        return buckets, watermark, counted
+
+    def _finish(self, total_rows, now, future_rows, window_start):
+        self.total_rows = total_rows
+        self.future_rows = future_rows
+        self.now = now
+        oldest = window_start.replace(minute=0, second=0, microsecond=0)
+        for hour in [hour for hour in self._buckets if hour < oldest]:
+            del self._buckets[hour]
+
+    def _totals(self, index):
+        totals = Counter()
+        for hour, counts in self._buckets.items():
+            if hour <= self.now:
+                for key, count in counts.items():
+                    totals[key[index]] += count
+        return totals
+
+    def complaint_counts(self):
+        """Encounters per chief complaint in the window, most frequent first."""
+        return self._totals(0).most_common()
+
+    def encounter_type_counts(self):
+        """Encounters per encounter type in the window, most frequent first."""
+        return self._totals(1).most_common()
+
+    def stats(self):
+        return {
+            **self._stats,
+            "buckets": len(self._buckets),
+            "future_rows": self.future_rows,
+            "watermark": self.watermark.isoformat() if self.watermark else None
+        }
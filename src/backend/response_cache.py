@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import time
+
+from serialization import json_dumpb
+
+
+class CachedValue:
+    __slots__ = ("value", "version", "checked_at")
+
+    def __init__(self, value, version, checked_at):
+        self.value = value
+        self.version = version
+        self.checked_at = checked_at
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "version", "checked_at")
+
+    def __init__(self, body, etag, version, checked_at):
+        self.body = body
+        self.etag = etag
+        self.version = version
+        self.checked_at = checked_at
+
+
+def make_etag(body):
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Implements the If-None-Match comparison, including lists and the "*" wildcard.
+
+    If-None-Match uses weak comparison, so a W/ prefix on either tag is ignored.
+    """
+    if not if_none_match:
+        return False
+    candidates = [_opaque_tag(tag.strip()) for tag in if_none_match.split(",")]
+    return "*" in candidates or _opaque_tag(etag) in candidates
+
+
+def _opaque_tag(tag):
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+class VersionedCache:
+    """In-process cache of computed values keyed by a data version.
+
+    An entry younger than `ttl` is served without touching the database. Once
+    it is older, `version_fn` (a cheap metadata query) is consulted: if the data
+    has not changed the entry is simply revalidated, otherwise `compute_fn`
+    rebuilds it. Concurrent misses for the same key share a single computation.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._entries = {}
+        self._inflight = {}
+        self._stats = {"hits": 0, "revalidations": 0, "misses": 0, "coalesced": 0}
+
+    async def get(self, key, version_fn, compute_fn):
+        """Returns (entry, status) where status is "hit", "revalidated" or "miss"."""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.checked_at < self.ttl:
+            self._stats["hits"] += 1
+            return entry, "hit"
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._refresh(key, entry, version_fn, compute_fn)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting on it.
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _refresh(self, key, entry, version_fn, compute_fn):
+        version = await version_fn()
+        if entry is not None and entry.version == version:
+            entry.checked_at = time.monotonic()
+            self._stats["revalidations"] += 1
+            return entry, "revalidated"
+
+        entry = self._make_entry(await compute_fn(), version)
+        self._entries[key] = entry
+        self._stats["misses"] += 1
+        return entry, "miss"
+
+    def _make_entry(self, value, version):
+        return CachedValue(value, version, time.monotonic())
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        return {**self._stats, "entries": len(self._entries)}
+
+
+class ResponseCache(VersionedCache):
+    """VersionedCache of JSON payloads, stored encoded with their ETag."""
+
+    def _make_entry(self, payload, version):
+        body = json_dumpb(payload)
+        return CachedResponse(body, make_etag(body), version, time.monotonic())
@@ -1,14 +1,21 @@
+import argparse
 import csv
-from faker import Faker
+import os
+import operator
 import random
-from datetime import datetime, timedelta
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
 
 # --- Configuration ---
 NUM_RECORDS = 1000
 OUTPUT_FILE = 'synthetic_patients.csv'
+DEFAULT_CHUNK_SIZE = 1_000_000
 
-# --- Initialize Faker ---
-fake = Faker()
+# Faker is only needed for the row-at-a-time mode
+fake = None
 
 # --- Sample Data ---
 conditions = [
@@ -25,6 +32,11 @@ chief_complaints = [
 
 encounter_types = ["Inpatient", "Outpatient", "Emergency", "Telehealth"]
 
+HEADER = [
+    "patient_id", "age", "conditions", "last_a1c_date",
+    "encounter_date", "chief_complaint", "encounter_type"
+]
+
 
 def create_synthetic_patient(patient_id):
     """Generates a single synthetic patient record."""
@@ -48,18 +60,17 @@ def create_synthetic_patient(patient_id):
         "encounter_type": random.choice(encounter_types)
     }
 
-def main():
-    """Generates a CSV file with synthetic patient data."""
-    header = [
-        "patient_id", "age", "conditions", "last_a1c_date",
-        "encounter_date", "chief_complaint", "encounter_type"
-    ]
+def generate_with_faker(num_records, output_file):
+    """Generates records one at a time with random + Faker (the original, slow path)."""
+    global fake
+    from faker import Faker
+    fake = Faker()
 
-    with open(OUTPUT_FILE, 'w', newline='') as f:
+    with open(output_file, 'w', newline='') as f:
         writer = csv.writer(f)
-        writer.writerow(header)
+        writer.writerow(HEADER)
 
-        for i in range(NUM_RECORDS):
+        for i in range(num_records):
             patient_id = fake.uuid4()
             patient_record = create_synthetic_patient(patient_id)
 
@@ -76,7 +87,203 @@ def main():
                 patient_record["encounter_type"]
             ])
 
-    print(f"Successfully generated {NUM_RECORDS} records in '{OUTPUT_FILE}'.")
+
+# --- Vectorized generation ---
+# Every column of a chunk is drawn with one NumPy call, and categorical values
+# are turned into text by indexing precomputed lookup tables, so Python only
+# touches each row once, to join the final CSV line.
+
+def _csv_field(value):
+    return f'"{value}"' if ',' in value else value
+
+
+def _lookup(values):
+    return np.array(values, dtype=object)
+
+
+AGE_TABLE = _lookup([str(age) for age in range(91)])
+COMPLAINT_TABLE = _lookup([_csv_field(c) for c in chief_complaints])
+ENCOUNTER_TYPE_TABLE = _lookup(encounter_types)
+# One CSV-ready "['a','b']" string for every subset of 0-4 conditions, grouped by subset size
+_SUBSETS_BY_SIZE = [
+    [mask for mask in range(1 << len(conditions)) if bin(mask).count('1') == k] for k in range(5)
+]
+CONDITIONS_TABLE = _lookup([
+    _csv_field("[" + ",".join(f"'{c}'" for bit, c in enumerate(conditions) if mask >> bit & 1) + "]")
+    for subsets in _SUBSETS_BY_SIZE for mask in subsets
+])
+SUBSET_COUNTS = np.array([len(subsets) for subsets in _SUBSETS_BY_SIZE])
+SUBSET_OFFSETS = np.concatenate(([0], np.cumsum(SUBSET_COUNTS)[:-1]))
+TIME_TABLE = _lookup([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(24 * 3600)])
+SECONDS_PER_DAY = 24 * 3600
+ONE_YEAR = 365 * SECONDS_PER_DAY
+
+
+def _uuid4_strings(rng, n):
+    """Random version-4 UUIDs built from raw random bytes."""
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hex_digits = np.frombuffer(raw.tobytes().hex().encode('ascii'), dtype=np.uint8).reshape(n, 32)
+    out = np.full((n, 36), ord('-'), dtype=np.uint8)
+    out[:, 0:8] = hex_digits[:, 0:8]
+    out[:, 9:13] = hex_digits[:, 8:12]
+    out[:, 14:18] = hex_digits[:, 12:16]
+    out[:, 19:23] = hex_digits[:, 16:20]
+    out[:, 24:36] = hex_digits[:, 20:32]
+    return out.view('S36').ravel().astype('U36').tolist()
+
+
+def _date_table(last_day, num_days):
+    """'YYYY-MM-DD' strings for the num_days days ending at last_day, oldest first."""
+    days = np.datetime64(last_day, 'D') - np.arange(num_days - 1, -1, -1).astype('timedelta64[D]')
+    return _lookup(np.datetime_as_string(days, unit='D').tolist())
+
+
+def generate_chunk(rng, n, anchor):
+    """Returns n CSV lines drawn from `rng`, with dates relative to the `anchor` datetime."""
+    ids = _uuid4_strings(rng, n)
+    ages = AGE_TABLE[rng.integers(18, 91, size=n)].tolist()
+
+    # 0-4 distinct conditions per row: pick a size, then a uniformly random subset of that size
+    num_conditions = rng.integers(0, 5, size=n)
+    subset_index = (rng.random(n) * SUBSET_COUNTS[num_conditions]).astype(np.int64)
+    condition_strs = CONDITIONS_TABLE[SUBSET_OFFSETS[num_conditions] + subset_index].tolist()
+
+    a1c_table = _date_table(anchor.date(), 366)
+    a1c_dates = a1c_table[365 - rng.integers(10, 366, size=n)].tolist()
+
+    # Encounter times are uniform over the year before the anchor, to the second
+    anchor_seconds = anchor.hour * 3600 + anchor.minute * 60 + anchor.second
+    seconds_before_midnight = anchor_seconds - rng.integers(0, ONE_YEAR + 1, size=n)
+    encounter_table = _date_table(anchor.date(), 367) + ' '
+    encounter_dates = list(map(
+        operator.add,
+        encounter_table[366 + seconds_before_midnight // SECONDS_PER_DAY].tolist(),
+        TIME_TABLE[seconds_before_midnight % SECONDS_PER_DAY].tolist()
+    ))
+
+    complaints = COMPLAINT_TABLE[rng.integers(0, len(chief_complaints), size=n)].tolist()
+    types = ENCOUNTER_TYPE_TABLE[rng.integers(0, len(encounter_types), size=n)].tolist()
+
+    return map(','.join, zip(ids, ages, condition_strs, a1c_dates, encounter_dates, complaints, types))
+
+
+def resolve_anchor(seed, anchor):
+    """Returns the datetime treated as 'now': `anchor` if given, else today at midnight for seeded runs, else the clock.
+
+    Seeded runs stay recent enough for Radar and the anomaly history, and are
+    reproduced on a later day by passing the printed anchor as --anchor-date.
+    """
+    if anchor is not None:
+        return anchor
+    if seed is not None:
+        return datetime.combine(date.today(), datetime.min.time())
+    return datetime.now()
+
+
+def generate_vectorized(num_records, output_file, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, anchor=None, verbose=True):
+    """Generates records in vectorized chunks and streams them to the CSV.
+
+    `seed` may be an int or a numpy SeedSequence. Output is identical for the
+    same seed, anchor, row count and chunk size; see resolve_anchor for the
+    anchor used when none is given.
+    """
+    rng = np.random.default_rng(seed)
+    anchor = resolve_anchor(seed, anchor)
+    if verbose:
+        print(f"🧬 Generating {num_records:,} rows (seed {seed}, anchor {anchor.isoformat()})")
+    start_time = time.time()
+    written = 0
+    with open(output_file, 'w', newline='') as f:
+        f.write(','.join(HEADER) + '\r\n')
+        while written < num_records:
+            n = min(chunk_size, num_records - written)
+            f.write('\r\n'.join(generate_chunk(rng, n, anchor)) + '\r\n')
+            written += n
+            if verbose:
+                elapsed = time.time() - start_time
+                print(f"   ⏳ {written:,}/{num_records:,} rows ({written / max(elapsed, 1e-9):,.0f} rows/sec)")
+    return written
+
+
+# --- Sharded generation ---
+# The row count is split into fixed-size shards, each with its own seed
+# spawned from the root seed and its own output file. A shard's contents
+# depend only on (root seed, shard index, shard size, chunk size, anchor), so
+# the dataset is identical no matter how many worker processes produce it.
+# The chunk size counts because each chunk draws its columns in turn from the
+# shard's generator.
+
+def shard_path(output_file, index):
+    stem, ext = os.path.splitext(output_file)
+    return f"{stem}-{index:05d}{ext or '.csv'}"
+
+
+def _generate_shard(job):
+    index, num_records, path, seed, chunk_size, anchor = job
+    generate_vectorized(num_records, path, seed, chunk_size, anchor, verbose=False)
+    return index, num_records, path
+
+
+def generate_sharded(num_records, output_file, seed=None, shard_size=DEFAULT_CHUNK_SIZE,
+                     chunk_size=DEFAULT_CHUNK_SIZE, anchor=None, workers=None):
+    """Generates `num_records` rows as shard files in parallel worker processes. Returns the shard paths."""
+    root = np.random.SeedSequence(seed)
+    anchor = resolve_anchor(seed, anchor)
+    num_shards = -(-num_records // shard_size)
+    shard_seeds = root.spawn(num_shards)
+    jobs = [
+        (i, min(shard_size, num_records - i * shard_size), shard_path(output_file, i),
+         shard_seeds[i], chunk_size, anchor)
+        for i in range(num_shards)
+    ]
+    print(f"🧬 Generating {num_shards} shards with {workers or os.cpu_count()} workers "
+          f"(seed {root.entropy}, anchor {anchor.isoformat()})")
+
+    start_time = time.time()
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for index, rows, path in executor.map(_generate_shard, jobs):
+            written += rows
+            elapsed = time.time() - start_time
+            print(f"   ⏳ shard {index + 1}/{num_shards} -> {path} "
+                  f"({written:,}/{num_records:,} rows, {written / max(elapsed, 1e-9):,.0f} rows/sec)")
+    return [job[2] for job in jobs]
+
+
+def main():
+    """Generates a CSV file with synthetic patient data."""
+    parser = argparse.ArgumentParser(description="Generate synthetic CareRadar patient encounters.")
+    parser.add_argument("--rows", type=int, default=NUM_RECORDS, help="Number of records to generate")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible output (vectorized mode)")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="CSV file to write")
+    parser.add_argument("--mode", choices=["vectorized", "faker"], default="vectorized",
+                        help="vectorized (NumPy, fast) or faker (original row-at-a-time generator)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Rows generated and written per chunk in vectorized mode (part of what a seed reproduces)")
+    parser.add_argument("--shard-size", type=int, default=0,
+                        help="Split the output into shard files of this many rows, generated in parallel (vectorized mode)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes for sharded generation (default: CPU count)")
+    parser.add_argument("--anchor-date", type=datetime.fromisoformat, default=None,
+                        help="Treat this datetime as 'now' when generating dates, e.g. 2025-10-01T00:00:00 "
+                             "(default: today at midnight when --seed is given, else the current time)")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.mode == "faker":
+        generate_with_faker(args.rows, args.output)
+    elif args.shard_size > 0:
+        paths = generate_sharded(args.rows, args.output, args.seed, args.shard_size,
+                                 args.chunk_size, args.anchor_date, args.workers)
+        print(f"Load them with: python setup_database.py --input '{shard_path(args.output, 0).replace('-00000', '-*')}'")
+    else:
+        generate_vectorized(args.rows, args.output, args.seed, args.chunk_size, args.anchor_date)
+    elapsed = time.time() - start_time
+
+    print(f"Successfully generated {args.rows} records in '{args.output}' "
+          f"({elapsed:.1f}s, {args.rows / max(elapsed, 1e-9):,.0f} rows/sec).")
 
 
 if __name__ == "__main__":
@@ -1,9 +1,15 @@
 import os
 import csv
+import argparse
 import ast
+import glob
+import itertools
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from clickhouse_driver import Client
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import date, datetime
 
 # --- Load Environment Variables ---
 # This line looks for a .env file in the current directory and loads its variables
@@ -18,7 +24,19 @@ CLICKHOUSE_USER = os.getenv('CLICKHOUSE_USER')
 CLICKHOUSE_PASSWORD = os.getenv('CLICKHOUSE_PASSWORD')
 
 TABLE_NAME = 'patients'
+PATIENT_DIM_TABLE = 'patient_dim'
+ENCOUNTERS_TABLE = 'encounters'
+# "wide": one denormalized row per encounter in `patients`.
+# "normalized": a patient dimension plus an encounters fact table; `patients`
+# becomes a view joining the two so ad-hoc SQL keeps working.
+DEFAULT_DATA_MODEL = os.getenv('CLICKHOUSE_DATA_MODEL', 'wide').lower()
 DATA_FILE = 'synthetic_patients.csv'
+DEFAULT_BATCH_SIZE = int(os.getenv('LOAD_BATCH_SIZE', 100_000))
+DEFAULT_INSERT_FORMAT = os.getenv('LOAD_INSERT_FORMAT', 'columnar')
+CSV_COLUMNS = [
+    'patient_id', 'age', 'conditions', 'last_a1c_date',
+    'encounter_date', 'chief_complaint', 'encounter_type'
+]
 
 
 def get_clickhouse_client():
@@ -38,10 +56,16 @@ def get_clickhouse_client():
         print(f"❌ Error connecting to ClickHouse: {e}")
         return None
 
-def create_patients_table(client):
-    """Creates the patients table in ClickHouse."""
-    create_table_query = f"""
-    CREATE TABLE IF NOT EXISTS {DATABASE_NAME}.{TABLE_NAME} (
+# --- Patients table schemas ---
+# Each version is the full column/engine definition of the patients table.
+# Version 1 is the original layout. Version 2 is the production layout:
+# categorical columns are LowCardinality, parts are partitioned by month so
+# time-window queries prune whole partitions, the primary key leads with
+# encounter_date and a projection sorted by patient_id keeps per-patient
+# lookups on an index. Delta + ZSTD codecs shrink the (mostly increasing)
+# date columns.
+PATIENTS_SCHEMAS = {
+    1: """
         patient_id String,
         age Int32,
         conditions Array(String),
@@ -50,58 +74,505 @@ def create_patients_table(client):
         chief_complaint String,
         encounter_type String
     ) ENGINE = MergeTree()
-    ORDER BY patient_id;
-    """
+    ORDER BY (patient_id, encounter_date)
+    """,
+    2: """
+        patient_id String CODEC(ZSTD(1)),
+        age Int32 CODEC(T64, ZSTD(1)),
+        conditions Array(LowCardinality(String)),
+        last_a1c_date Date CODEC(Delta, ZSTD(1)),
+        encounter_date DateTime CODEC(Delta, ZSTD(1)),
+        chief_complaint LowCardinality(String),
+        encounter_type LowCardinality(String),
+        PROJECTION by_patient (
+            SELECT * ORDER BY patient_id, encounter_date
+        )
+    ) ENGINE = MergeTree()
+    PARTITION BY toYYYYMM(encounter_date)
+    ORDER BY (encounter_date, patient_id)
+    """,
+}
+LATEST_SCHEMA_VERSION = max(PATIENTS_SCHEMAS)
+DEFAULT_SCHEMA_VERSION = int(os.getenv('PATIENTS_SCHEMA_VERSION', LATEST_SCHEMA_VERSION))
+SCHEMA_VERSION_TABLE = 'schema_versions'
+
+
+def patients_table_ddl(table=TABLE_NAME, version=DEFAULT_SCHEMA_VERSION):
+    return f"CREATE TABLE {DATABASE_NAME}.{table} ({PATIENTS_SCHEMAS[version]}"
+
+def record_schema_version(client, version, table=TABLE_NAME):
+    client.execute(f"""
+    CREATE TABLE IF NOT EXISTS {DATABASE_NAME}.{SCHEMA_VERSION_TABLE} (
+        table_name String,
+        version UInt32,
+        applied_at DateTime DEFAULT now()
+    ) ENGINE = MergeTree()
+    ORDER BY (table_name, applied_at)
+    """)
+    client.execute(
+        f"INSERT INTO {DATABASE_NAME}.{SCHEMA_VERSION_TABLE} (table_name, version) VALUES",
+        [(table, version)]
+    )
+
+def get_schema_version(client, table=TABLE_NAME):
+    """Returns the recorded schema version of `table`; tables created before versioning report 1."""
+    exists = client.execute(
+        "SELECT count() FROM system.tables WHERE database = %(db)s AND name = %(name)s",
+        {"db": DATABASE_NAME, "name": SCHEMA_VERSION_TABLE}
+    )[0][0]
+    if not exists:
+        return 1
+    rows = client.execute(
+        f"SELECT argMax(version, applied_at) FROM {DATABASE_NAME}.{SCHEMA_VERSION_TABLE} "
+        "WHERE table_name = %(name)s HAVING count() > 0",
+        {"name": table}
+    )
+    return rows[0][0] if rows else 1
+
+def create_patients_table(client, version=DEFAULT_SCHEMA_VERSION):
+    """Creates the patients table in ClickHouse using the given schema version."""
     try:
         client.execute(f"DROP TABLE IF EXISTS {DATABASE_NAME}.{TABLE_NAME}")
         print(f"🧹 Dropped existing table '{TABLE_NAME}' (if any).")
-        client.execute(create_table_query)
-        print(f"✅ Table '{TABLE_NAME}' created successfully.")
+        client.execute(patients_table_ddl(TABLE_NAME, version))
+        record_schema_version(client, version)
+        print(f"✅ Table '{TABLE_NAME}' created successfully (schema v{version}).")
     except Exception as e:
         print(f"❌ Error creating table: {e}")
 
-def load_data_from_csv(client):
-    """Loads data from the generated CSV into the ClickHouse table."""
+def migrate_patients_table(client, version=LATEST_SCHEMA_VERSION, keep_old=False):
+    """Rebuilds the existing patients table in another schema version without reloading the CSVs.
+
+    Rows are copied into a new table with INSERT ... SELECT, the two tables are
+    swapped atomically, and the rollups are rebuilt against the new table.
+    The previous table is kept as patients_v<old> when `keep_old` is set.
+    """
+    current = get_schema_version(client)
+    if current == version:
+        print(f"✅ Table '{TABLE_NAME}' is already at schema v{version}.")
+        return True
+
+    new_table = f"{TABLE_NAME}_v{version}"
+    columns = ', '.join(CSV_COLUMNS)
+    start_time = time.time()
     try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            next(reader)  # Skip header row
-
-            processed_rows = []
-            for row in reader:
-                # Convert data types for each column to match the ClickHouse schema
-                processed_row = [
-                    row[0],                             # patient_id (String)
-                    int(row[1]),                        # age (String -> Int32)
-                    ast.literal_eval(row[2]),           # conditions (String -> Array(String))
-                    datetime.strptime(row[3], '%Y-%m-%d').date(), # last_a1c_date (String -> Date)
-                    datetime.strptime(row[4], '%Y-%m-%d %H:%M:%S'), # encounter_date (String -> DateTime)
-                    row[5],                             # chief_complaint (String)
-                    row[6]                              # encounter_type (String)
-                ]
-                processed_rows.append(processed_row)
-
-            client.execute(
-                f'INSERT INTO {DATABASE_NAME}.{TABLE_NAME} VALUES',
-                processed_rows
+        print(f"🔁 Migrating '{TABLE_NAME}' from schema v{current} to v{version}...")
+        client.execute(f"DROP TABLE IF EXISTS {DATABASE_NAME}.{new_table}")
+        client.execute(patients_table_ddl(new_table, version))
+        client.execute(
+            f"INSERT INTO {DATABASE_NAME}.{new_table} ({columns}) "
+            f"SELECT {columns} FROM {DATABASE_NAME}.{TABLE_NAME}"
+        )
+        old_count = client.execute(f"SELECT count() FROM {DATABASE_NAME}.{TABLE_NAME}")[0][0]
+        new_count = client.execute(f"SELECT count() FROM {DATABASE_NAME}.{new_table}")[0][0]
+        if old_count != new_count:
+            raise RuntimeError(f"copied {new_count:,} of {old_count:,} rows")
+
+        # After the exchange, new_table holds the old data.
+        client.execute(f"EXCHANGE TABLES {DATABASE_NAME}.{TABLE_NAME} AND {DATABASE_NAME}.{new_table}")
+        old_table = f"{TABLE_NAME}_v{current}"
+        if keep_old:
+            client.execute(f"DROP TABLE IF EXISTS {DATABASE_NAME}.{old_table}")
+            client.execute(f"RENAME TABLE {DATABASE_NAME}.{new_table} TO {DATABASE_NAME}.{old_table}")
+        else:
+            client.execute(f"DROP TABLE {DATABASE_NAME}.{new_table}")
+        record_schema_version(client, version)
+        print(f"✅ Migrated {new_count:,} rows to schema v{version} in {time.time() - start_time:.1f}s"
+              + (f"; previous table kept as '{old_table}'." if keep_old else "."))
+    except Exception as e:
+        print(f"❌ Error migrating table: {e}")
+        return False
+
+    # The materialized views were bound to the old table, so rebuild them.
+    create_rollup_tables(client, 'wide')
+    return True
+
+def create_normalized_tables(client):
+    """Creates the patient dimension, the encounters fact table and the `patients` compatibility view.
+
+    patient_dim holds one row per patient; ReplacingMergeTree keeps the version
+    from the most recent encounter when a patient is loaded more than once, so
+    after the post-load OPTIMIZE a plain count() is the patient count.
+    encounters uses the same partitioning and ordering as the v2 wide table.
+    """
+    try:
+        # DROP TABLE also removes the view left by a previous normalized setup.
+        client.execute(f"DROP TABLE IF EXISTS {DATABASE_NAME}.{TABLE_NAME}")
+        client.execute(f"DROP TABLE IF EXISTS {DATABASE_NAME}.{PATIENT_DIM_TABLE}")
+        client.execute(f"DROP TABLE IF EXISTS {DATABASE_NAME}.{ENCOUNTERS_TABLE}")
+        print(f"🧹 Dropped existing '{TABLE_NAME}', '{PATIENT_DIM_TABLE}' and '{ENCOUNTERS_TABLE}' (if any).")
+        client.execute(f"""
+        CREATE TABLE {DATABASE_NAME}.{PATIENT_DIM_TABLE} (
+            patient_id String CODEC(ZSTD(1)),
+            age Int32 CODEC(T64, ZSTD(1)),
+            conditions Array(LowCardinality(String)),
+            last_a1c_date Date CODEC(Delta, ZSTD(1)),
+            last_encounter_date DateTime CODEC(Delta, ZSTD(1))
+        ) ENGINE = ReplacingMergeTree(last_encounter_date)
+        ORDER BY patient_id
+        """)
+        client.execute(f"""
+        CREATE TABLE {DATABASE_NAME}.{ENCOUNTERS_TABLE} (
+            patient_id String CODEC(ZSTD(1)),
+            encounter_date DateTime CODEC(Delta, ZSTD(1)),
+            chief_complaint LowCardinality(String),
+            encounter_type LowCardinality(String),
+            PROJECTION by_patient (
+                SELECT * ORDER BY patient_id, encounter_date
             )
-            print(f"✅ Data from '{DATA_FILE}' loaded successfully into '{TABLE_NAME}'.")
+        ) ENGINE = MergeTree()
+        PARTITION BY toYYYYMM(encounter_date)
+        ORDER BY (encounter_date, patient_id)
+        """)
+        client.execute(f"""
+        CREATE VIEW {DATABASE_NAME}.{TABLE_NAME} AS
+        SELECT e.patient_id AS patient_id, p.age AS age, p.conditions AS conditions,
+               p.last_a1c_date AS last_a1c_date, e.encounter_date AS encounter_date,
+               e.chief_complaint AS chief_complaint, e.encounter_type AS encounter_type
+        FROM {DATABASE_NAME}.{ENCOUNTERS_TABLE} AS e
+        LEFT JOIN (SELECT * FROM {DATABASE_NAME}.{PATIENT_DIM_TABLE} FINAL) AS p USING (patient_id)
+        """)
+        print(f"✅ Tables '{PATIENT_DIM_TABLE}' and '{ENCOUNTERS_TABLE}' and view '{TABLE_NAME}' created successfully.")
+    except Exception as e:
+        print(f"❌ Error creating normalized tables: {e}")
+
+def create_rollup_tables(client, data_model=DEFAULT_DATA_MODEL):
+    """Creates the Analytics rollup tables and the materialized views that keep them current on insert."""
+    normalized = data_model == 'normalized'
+    encounters_source = f"{DATABASE_NAME}.{ENCOUNTERS_TABLE if normalized else TABLE_NAME}"
+    patients_source = f"{DATABASE_NAME}.{PATIENT_DIM_TABLE if normalized else TABLE_NAME}"
+    rollups = {
+        # Encounters and distinct patients per week and encounter type
+        "analytics_weekly": (
+            """
+            week Date,
+            encounter_type String,
+            encounters SimpleAggregateFunction(sum, UInt64),
+            patients AggregateFunction(uniq, String)
+            """,
+            "week, encounter_type",
+            f"""
+            SELECT toStartOfWeek(encounter_date) AS week, encounter_type,
+                   count() AS encounters, uniqState(patient_id) AS patients
+            FROM {encounters_source}
+            GROUP BY week, encounter_type
+            """
+        ),
+        # Distinct patients per condition
+        "analytics_conditions": (
+            """
+            condition String,
+            patients AggregateFunction(uniq, String)
+            """,
+            "condition",
+            f"""
+            SELECT arrayJoin(conditions) AS condition, uniqState(patient_id) AS patients
+            FROM {patients_source}
+            GROUP BY condition
+            """
+        ),
+        # Encounters per chief complaint
+        "analytics_complaints": (
+            """
+            chief_complaint String,
+            encounters SimpleAggregateFunction(sum, UInt64)
+            """,
+            "chief_complaint",
+            f"""
+            SELECT chief_complaint, count() AS encounters
+            FROM {encounters_source}
+            GROUP BY chief_complaint
+            """
+        ),
+        # HyperLogLog state of every patient_id, merged into a single row over time
+        "patient_population": (
+            """
+            patients AggregateFunction(uniqCombined, String)
+            """,
+            "tuple()",
+            f"""
+            SELECT uniqCombinedState(patient_id) AS patients
+            FROM {patients_source}
+            """
+        ),
+    }
+    try:
+        for name, (columns, order_by, select_query) in rollups.items():
+            client.execute(f"DROP VIEW IF EXISTS {DATABASE_NAME}.{name}_mv")
+            client.execute(f"DROP TABLE IF EXISTS {DATABASE_NAME}.{name}")
+            client.execute(f"""
+            CREATE TABLE {DATABASE_NAME}.{name} ({columns})
+            ENGINE = AggregatingMergeTree()
+            ORDER BY ({order_by})
+            """)
+            client.execute(f"CREATE MATERIALIZED VIEW {DATABASE_NAME}.{name}_mv TO {DATABASE_NAME}.{name} AS {select_query}")
+            # Backfill from rows that were already loaded before the view existed
+            client.execute(f"INSERT INTO {DATABASE_NAME}.{name} {select_query}")
+        print(f"✅ Rollup tables created: {', '.join(rollups)}")
     except Exception as e:
-        print(f"❌ Error loading data from CSV: {e}")
+        print(f"❌ Error creating rollup tables: {e}")
+
+# A list of plain single-quoted strings, as written by generate_data.py or str(list).
+CONDITIONS_PATTERN = re.compile(r"\[\s*(?:'[^'\\\"]*'(?:\s*,\s*'[^'\\\"]*')*)?\s*\]")
+CONDITIONS_SEPARATOR = re.compile(r"'\s*,\s*'")
+
+def parse_conditions(value):
+    """Parses the "['a','b']" / "['a', 'b']" array format written by generate_data.py or str(list).
+
+    Much cheaper than ast.literal_eval for the common case; anything that is
+    not a list of plain single-quoted strings (escapes, double quotes, other
+    literals) goes through literal_eval, which raises on malformed input.
+    """
+    value = value.strip()
+    if not CONDITIONS_PATTERN.fullmatch(value):
+        return ast.literal_eval(value)
+    inner = value[1:-1].strip()
+    if not inner:
+        return []
+    return CONDITIONS_SEPARATOR.split(inner[1:-1])
+
+def parse_row(row):
+    """Converts one CSV row to the column types of the patients table."""
+    return [
+        row[0],                             # patient_id (String)
+        int(row[1]),                        # age (String -> Int32)
+        parse_conditions(row[2]),           # conditions (String -> Array(String))
+        date.fromisoformat(row[3]),         # last_a1c_date (String -> Date)
+        datetime.fromisoformat(row[4]),     # encounter_date (String -> DateTime)
+        row[5],                             # chief_complaint (String)
+        row[6]                              # encounter_type (String)
+    ]
+
+def parse_columns(rows):
+    """Transposes raw CSV rows into typed column lists, converting each column with a single map()."""
+    ids, ages, conditions, a1c_dates, encounter_dates, complaints, encounter_types = zip(*rows)
+    return [
+        list(ids),
+        list(map(int, ages)),
+        list(map(parse_conditions, conditions)),
+        list(map(date.fromisoformat, a1c_dates)),
+        list(map(datetime.fromisoformat, encounter_dates)),
+        list(complaints),
+        list(encounter_types)
+    ]
+
+def split_normalized(columns):
+    """Splits a columnar batch into (patient_dim columns, encounters columns).
+
+    A patient appearing several times in the batch keeps the attributes of
+    their most recent encounter, matching the ReplacingMergeTree version.
+    """
+    ids, ages, conditions, a1c_dates, encounter_dates, complaints, encounter_types = columns
+    latest = {}
+    for i, (patient_id, encounter_date) in enumerate(zip(ids, encounter_dates)):
+        j = latest.get(patient_id)
+        if j is None or encounter_date >= encounter_dates[j]:
+            latest[patient_id] = i
+    index = list(latest.values())
+    patients = [[column[i] for i in index] for column in (ids, ages, conditions, a1c_dates, encounter_dates)]
+    return patients, [ids, encounter_dates, complaints, encounter_types]
+
+def iter_batches(path, batch_size, start_row=0, columnar=False):
+    """Streams parsed batches from a CSV, skipping the first `start_row` data rows.
+
+    Batches are lists of rows, or lists of columns when `columnar` is set.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)  # Skip header row
+        for _ in itertools.islice(reader, start_row):
+            pass
+        while True:
+            rows = list(itertools.islice(reader, batch_size))
+            if not rows:
+                return
+            yield parse_columns(rows) if columnar else [parse_row(row) for row in rows]
+
+def load_data_from_csv(client, path=DATA_FILE, batch_size=DEFAULT_BATCH_SIZE, start_row=0,
+                       insert_format=DEFAULT_INSERT_FORMAT, table=TABLE_NAME, data_model=DEFAULT_DATA_MODEL):
+    """Streams a generated CSV into the ClickHouse table one batch at a time.
+
+    With insert_format="columnar" each batch is sent as column arrays, which
+    clickhouse_driver serializes column by column instead of value by value.
+    With data_model="normalized" each batch is split into patient_dim and
+    encounters inserts, which are always sent as columns.
+    Returns (rows inserted, error message or None).
+    """
+    name = os.path.basename(path)
+    normalized = data_model == 'normalized'
+    columnar = insert_format == 'columnar' or normalized
+    insert_query = f"INSERT INTO {DATABASE_NAME}.{table} ({', '.join(CSV_COLUMNS)}) VALUES"
+    patient_insert_query = (f"INSERT INTO {DATABASE_NAME}.{PATIENT_DIM_TABLE} "
+                            "(patient_id, age, conditions, last_a1c_date, last_encounter_date) VALUES")
+    encounter_insert_query = (f"INSERT INTO {DATABASE_NAME}.{ENCOUNTERS_TABLE} "
+                              "(patient_id, encounter_date, chief_complaint, encounter_type) VALUES")
+    loaded = 0
+    start_time = time.time()
+    try:
+        for batch in iter_batches(path, batch_size, start_row, columnar):
+            if normalized:
+                patients, encounters = split_normalized(batch)
+                client.execute(patient_insert_query, patients, columnar=True)
+                client.execute(encounter_insert_query, encounters, columnar=True)
+            else:
+                client.execute(insert_query, batch, columnar=columnar)
+            loaded += len(batch[0]) if columnar else len(batch)
+            elapsed = time.time() - start_time
+            print(f"   ⏳ {name}: {start_row + loaded:,} rows loaded ({loaded / elapsed:,.0f} rows/sec)")
+        elapsed = time.time() - start_time
+        target = f"'{PATIENT_DIM_TABLE}'/'{ENCOUNTERS_TABLE}'" if normalized else f"'{table}'"
+        print(f"✅ Data from '{path}' loaded successfully into {target}: "
+              f"{loaded:,} rows in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):,.0f} rows/sec).")
+        return loaded, None
+    except Exception as e:
+        print(f"❌ Error loading data from {name}: {e}")
+        print(f"   Resume with: --append --input {path} --start-row {start_row + loaded}")
+        return loaded, str(e)
+
+def resolve_input_files(patterns):
+    """Expands directories and glob patterns into a sorted, de-duplicated list of CSV files."""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.extend(glob.glob(os.path.join(pattern, '*.csv')))
+        else:
+            files.extend(glob.glob(pattern) or ([pattern] if os.path.exists(pattern) else []))
+    return sorted(set(files))
+
+def benchmark_insert_formats(client, path, batch_size=DEFAULT_BATCH_SIZE, version=DEFAULT_SCHEMA_VERSION):
+    """Loads the same file with the row and columnar insert paths into a scratch table and compares throughput.
+
+    The scratch table is created from the schema definition, so the real
+    patients table is never touched.
+    """
+    bench_table = f"{TABLE_NAME}_insert_bench"
+    results = {}
+    try:
+        for insert_format in ('row', 'columnar'):
+            client.execute(f"DROP TABLE IF EXISTS {DATABASE_NAME}.{bench_table}")
+            client.execute(patients_table_ddl(bench_table, version))
+            start_time = time.time()
+            loaded, error = load_data_from_csv(client, path, batch_size, insert_format=insert_format, table=bench_table)
+            if error:
+                return results
+            results[insert_format] = loaded / max(time.time() - start_time, 1e-9)
+    finally:
+        client.execute(f"DROP TABLE IF EXISTS {DATABASE_NAME}.{bench_table}")
+
+    print(f"🏁 Insert benchmark on '{path}' (batch size {batch_size:,}):")
+    for insert_format, rate in results.items():
+        print(f"   {insert_format:>8}: {rate:,.0f} rows/sec")
+    if len(results) == 2:
+        print(f"   columnar speedup: {results['columnar'] / results['row']:.2f}x")
+    return results
+
+def load_file_worker(path, batch_size, insert_format=DEFAULT_INSERT_FORMAT, data_model=DEFAULT_DATA_MODEL):
+    """Process-pool entry point: parses and inserts one file over the worker's own connection."""
+    client = get_clickhouse_client()
+    if not client:
+        return path, 0, 0.0, "could not connect to ClickHouse"
+    start_time = time.time()
+    try:
+        loaded, error = load_data_from_csv(client, path, batch_size, insert_format=insert_format, data_model=data_model)
+        return path, loaded, time.time() - start_time, error
+    finally:
+        client.disconnect()
+
+def load_files_parallel(paths, workers, batch_size=DEFAULT_BATCH_SIZE, insert_format=DEFAULT_INSERT_FORMAT,
+                        data_model=DEFAULT_DATA_MODEL):
+    """Ingests many CSV shards with a pool of worker processes and prints an aggregate throughput report."""
+    print(f"🚚 Loading {len(paths)} files with {workers} worker processes...")
+    start_time = time.time()
+    total_rows = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(load_file_worker, path, batch_size, insert_format, data_model) for path in paths]
+        for future in as_completed(futures):
+            path, loaded, _, error = future.result()
+            total_rows += loaded
+            if error:
+                failed.append((path, error))
+    elapsed = time.time() - start_time
+    print(f"📈 Loaded {total_rows:,} rows from {len(paths) - len(failed)}/{len(paths)} files "
+          f"in {elapsed:.1f}s ({total_rows / max(elapsed, 1e-9):,.0f} rows/sec aggregate).")
+    for path, error in failed:
+        print(f"❌ {path}: {error}")
+    return total_rows
 
 def main():
     """Main function to set up the database and load data."""
+    parser = argparse.ArgumentParser(description="Create the CareRadar ClickHouse schema and load patient data.")
+    parser.add_argument("--schema-version", type=int, choices=sorted(PATIENTS_SCHEMAS), default=DEFAULT_SCHEMA_VERSION,
+                        help="Patients table layout to create or migrate to (1 = original, 2 = partitioned/LowCardinality)")
+    parser.add_argument("--data-model", choices=["wide", "normalized"], default=DEFAULT_DATA_MODEL,
+                        help="One wide patients table, or a patient_dim + encounters split (set CLICKHOUSE_DATA_MODEL for the API to match)")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Convert the existing patients table to --schema-version in place, then exit")
+    parser.add_argument("--keep-old", action="store_true",
+                        help="With --migrate, keep the previous table as patients_v<old version>")
+    parser.add_argument("--rollups-only", action="store_true",
+                        help="Only (re)create and backfill the Analytics rollup tables on an existing patients table")
+    parser.add_argument("--input", "--file", dest="inputs", nargs="+", default=[DATA_FILE],
+                        help="CSV files, directories or glob patterns to load")
+    parser.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, 8),
+                        help="Worker processes used when loading several files")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per INSERT")
+    parser.add_argument("--insert-format", choices=["row", "columnar"], default=DEFAULT_INSERT_FORMAT,
+                        help="Send batches as row tuples or as column arrays")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Compare row vs columnar insert throughput on the first input file using a scratch table")
+    parser.add_argument("--append", action="store_true",
+                        help="Load into the existing tables instead of recreating them")
+    parser.add_argument("--start-row", type=int, default=0,
+                        help="Skip this many data rows of a single input file, e.g. to resume an interrupted load")
+    args = parser.parse_args()
+
+    paths = resolve_input_files(args.inputs)
+    if not (args.rollups_only or args.migrate) and not paths:
+        parser.error(f"No input files matched {args.inputs}")
+    normalized = args.data_model == 'normalized'
+    if normalized and (args.migrate or args.benchmark):
+        parser.error("--migrate and --benchmark apply to the wide patients table only")
+    if args.start_row and len(paths) > 1:
+        parser.error("--start-row can only be used with a single input file")
+
     client = get_clickhouse_client()
-    if client:
-        create_patients_table(client)
-        load_data_from_csv(client)
+    if client and args.migrate:
+        migrate_patients_table(client, args.schema_version, args.keep_old)
+        client.disconnect()
+    elif client and args.rollups_only:
+        create_rollup_tables(client, args.data_model)
+        client.disconnect()
+    elif client and args.benchmark:
+        benchmark_insert_formats(client, paths[0], args.batch_size, args.schema_version)
+        client.disconnect()
+    elif client:
+        if not args.append:
+            if normalized:
+                create_normalized_tables(client)
+            else:
+                create_patients_table(client, args.schema_version)
+            create_rollup_tables(client, args.data_model)
+        if len(paths) == 1 or args.workers <= 1:
+            for path in paths:
+                load_data_from_csv(client, path, args.batch_size, args.start_row, args.insert_format,
+                                   data_model=args.data_model)
+        else:
+            load_files_parallel(paths, args.workers, args.batch_size, args.insert_format, args.data_model)
         
         # Verify the number of records loaded
-        count = client.execute(f'SELECT count() FROM {DATABASE_NAME}.{TABLE_NAME}')[0][0]
-        print(f"📊 Verification: Found {count} records in the '{TABLE_NAME}' table.")
+        if normalized:
+            # Collapse patients that were loaded more than once so count() is exact.
+            client.execute(f"OPTIMIZE TABLE {DATABASE_NAME}.{PATIENT_DIM_TABLE} FINAL")
+            encounters = client.execute(f'SELECT count() FROM {DATABASE_NAME}.{ENCOUNTERS_TABLE}')[0][0]
+            patients = client.execute(f'SELECT count() FROM {DATABASE_NAME}.{PATIENT_DIM_TABLE}')[0][0]
+            print(f"📊 Verification: Found {encounters} encounters for {patients} patients.")
+        else:
+            count = client.execute(f'SELECT count() FROM {DATABASE_NAME}.{TABLE_NAME}')[0][0]
+            print(f"📊 Verification: Found {count} records in the '{TABLE_NAME}' table.")
         
         client.disconnect()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
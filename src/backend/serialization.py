@@ -0,0 +1,73 @@
+import datetime
+import decimal
+import json
+import uuid
+
+from fastapi.responses import JSONResponse
+
+# --- JSON backend ---
+# orjson is used when installed: it is several times faster than the stdlib
+# and encodes the date/datetime/UUID values ClickHouse returns natively, so
+# results can be serialized without converting them first. Without it the
+# stdlib is used with an equivalent fallback for those types.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def json_dumpb(obj):
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def json_dumps(obj):
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode("utf-8")
+
+    json_loads = orjson.loads
+else:
+    def json_dumpb(obj):
+        return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def json_dumps(obj):
+        return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False)
+
+    json_loads = json.loads
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the fastest available encoder.
+
+    Endpoints return this directly: FastAPI would otherwise walk the payload
+    with jsonable_encoder before the response class ever sees it.
+    """
+
+    def render(self, content):
+        return json_dumpb(content)
+
+
+# --- Columnar result shaping ---
+
+def columns_to_rows(column_types, columns, limit=None):
+    """Turns a columnar result (as returned by execute(..., columnar=True, with_column_types=True)) into row dicts.
+
+    Values are left as the driver returned them; dates and UUIDs are handled by the JSON encoder.
+    """
+    names = [name for name, _ in column_types]
+    if limit is not None:
+        columns = [values[:limit] for values in columns]
+    return [dict(zip(names, row)) for row in zip(*columns)]
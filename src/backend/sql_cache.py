@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import math
+import operator
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# --- Question normalization ---
+
+_NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+_TENS_WORDS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50,
+    "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+_TENS_RE = re.compile(r"\b(" + "|".join(_TENS_WORDS) + r")(?:[\s-]+(" + "|".join(list(_NUMBER_WORDS)[1:10]) + r"))?\b")
+_UNITS_RE = re.compile(r"\b(" + "|".join(_NUMBER_WORDS) + r")\b")
+_THOUSANDS_RE = re.compile(r"(?<=\d),(?=\d{3}\b)")
+_TRAILING_ZEROS_RE = re.compile(r"\b(\d+)\.0+\b")
+_PUNCTUATION_RE = re.compile(r"[?!,;:\"()\[\]{}]|\.(?!\d)")
+_WHITESPACE_RE = re.compile(r"\s+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _tens_to_digits(match):
+    value = _TENS_WORDS[match.group(1)]
+    if match.group(2):
+        value += _NUMBER_WORDS[match.group(2)]
+    return str(value)
+
+
+def normalize_question(question):
+    """Canonicalizes case, whitespace, punctuation and numbers so rewordings share a cache key.
+
+    "Diabetic patients over Sixty-Five?" and "diabetic patients over 65" both
+    normalize to "diabetic patients over 65". Comparison operators are kept
+    because they change the meaning of the question.
+    """
+    text = question.lower().strip()
+    text = _TENS_RE.sub(_tens_to_digits, text)
+    text = _UNITS_RE.sub(lambda m: str(_NUMBER_WORDS[m.group(1)]), text)
+    text = _THOUSANDS_RE.sub("", text)
+    text = _TRAILING_ZEROS_RE.sub(r"\1", text)
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def schema_fingerprint(*parts):
+    """Hashes the schema prompt (and anything else the SQL depends on) into a cache version."""
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _unit(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def load_local_embedder(model_name):
+    """Returns a text -> unit-vector function backed by sentence-transformers, or None if unavailable."""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logging.warning("sentence-transformers is not installed; semantic SQL cache tier disabled")
+        return None
+    model = SentenceTransformer(model_name)
+    return lambda text: model.encode(text, normalize_embeddings=True).tolist()
+
+
+class _Entry:
+    __slots__ = ("sql", "expires_at", "embedding", "numbers")
+
+    def __init__(self, sql, expires_at, embedding, numbers):
+        self.sql = sql
+        self.expires_at = expires_at
+        self.embedding = embedding
+        self.numbers = numbers
+
+
+class TranslationCache:
+    """LRU + TTL cache of natural-language question -> generated SQL.
+
+    Lookups first try an exact match on the normalized question. When an
+    embedding function is configured, a second tier returns the SQL of the most
+    similar cached question above `similarity_threshold` - but only if both
+    questions mention the same numbers, since "over 60" and "over 70" embed
+    almost identically yet need different SQL.
+    """
+
+    def __init__(self, max_entries=512, ttl=3600, schema_version="", embed_fn=None, similarity_threshold=0.93):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.schema_version = schema_version
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def semantic_enabled(self):
+        return self.embed_fn is not None
+
+    def _key(self, normalized):
+        return (self.schema_version, normalized)
+
+    def _live(self, key, entry, now):
+        if entry.expires_at < now or key[0] != self.schema_version:
+            del self._entries[key]
+            return False
+        return True
+
+    def get(self, question):
+        """Exact-tier lookup on the normalized question. Cheap enough to call on the event loop."""
+        key = self._key(normalize_question(question))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._live(key, entry, now):
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry.sql
+            if not self.semantic_enabled:
+                self._stats["misses"] += 1
+        return None
+
+    def get_similar(self, question):
+        """Embedding-tier lookup. Runs the embedding model, so call it off the event loop."""
+        if not self.semantic_enabled:
+            return None
+        normalized = normalize_question(question)
+        numbers = tuple(_NUMBER_RE.findall(normalized))
+        query_vec = _unit(self.embed_fn(normalized))
+        now = time.monotonic()
+        best_key, best_score = None, self.similarity_threshold
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if not self._live(key, entry, now) or entry.embedding is None or entry.numbers != numbers:
+                    continue
+                score = sum(map(operator.mul, query_vec, entry.embedding))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._stats["semantic_hits"] += 1
+            return self._entries[best_key].sql
+
+    def put(self, question, sql):
+        normalized = normalize_question(question)
+        embedding = None
+        if self.semantic_enabled:
+            embedding = _unit(self.embed_fn(normalized))
+        entry = _Entry(sql, time.monotonic() + self.ttl, embedding, tuple(_NUMBER_RE.findall(normalized)))
+        with self._lock:
+            key = self._key(normalized)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, question):
+        """Forgets a cached translation, e.g. after the SQL failed to execute."""
+        with self._lock:
+            self._entries.pop(self._key(normalize_question(question)), None)
+
+    def invalidate(self, schema_version=None):
+        """Drops every entry; optionally switches to a new schema version."""
+        with self._lock:
+            if schema_version is not None:
+                self.schema_version = schema_version
+            self._entries.clear()
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "schema_version": self.schema_version}
@@ -0,0 +1,145 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+
+# --- Post-processing for LLM-generated SQL ---
+# The model's SQL is executed as-is, so it can be unbounded. Every query is
+# wrapped in an outer LIMIT/OFFSET and run with per-query resource limits, so
+# memory and latency scale with the page size rather than with the table.
+
+_LEADING_COMMENTS_RE = re.compile(r"^(\s*(--[^\n]*\n|/\*.*?\*/))*\s*", re.S)
+_READ_STATEMENT_RE = re.compile(r"^(SELECT|WITH)\b", re.I)
+_FORMAT_CLAUSE_RE = re.compile(r"\s+FORMAT\s+\w+\s*$", re.I)
+
+
+class UnsafeQueryError(ValueError):
+    """Raised when generated SQL is not a single read-only statement."""
+
+
+def clean_sql(sql):
+    """Strips comments, trailing semicolons and FORMAT clauses, and checks the statement is a single SELECT."""
+    sql = _LEADING_COMMENTS_RE.sub("", sql).strip().rstrip(";").strip()
+    sql = _FORMAT_CLAUSE_RE.sub("", sql)
+    if not _READ_STATEMENT_RE.match(sql):
+        raise UnsafeQueryError("Only SELECT queries can be run from Query Mode")
+    if ";" in _strip_string_literals(sql):
+        raise UnsafeQueryError("Generated SQL must be a single statement")
+    return sql
+
+
+def _strip_string_literals(sql):
+    return re.sub(r"'(?:[^'\\]|\\.)*'", "''", sql)
+
+
+_PARENTHESIZED_RE = re.compile(r"\([^()]*\)")
+_ORDER_BY_RE = re.compile(r"\bORDER\s+BY\b", re.I)
+
+
+def _top_level(sql):
+    sql = _strip_string_literals(sql)
+    while True:
+        stripped = _PARENTHESIZED_RE.sub("()", sql)
+        if stripped == sql:
+            return sql
+        sql = stripped
+
+
+def has_order_by(sql):
+    """True if the statement itself (not a subquery, CTE or window) has an ORDER BY."""
+    return bool(_ORDER_BY_RE.search(_top_level(sql)))
+
+
+_BOUNDED_RE = re.compile(r"\b(LIMIT|GROUP\s+BY|DISTINCT)\b", re.I)
+
+# Sort key of the v2 patients and the encounters tables. Ordering pages by a
+# prefix of it lets ClickHouse read in order and stop once the page is full.
+STREAM_ORDER_COLUMNS = ("encounter_date", "patient_id")
+
+
+def is_bounded(sql):
+    """True if the statement itself has a LIMIT, GROUP BY or DISTINCT, so its result is small or already materialized."""
+    return bool(_BOUNDED_RE.search(_top_level(sql)))
+
+
+def page_order(sql, columns):
+    """ORDER BY clause that keeps OFFSET pages of `sql` consistent, given its output column names.
+
+    A query with its own ORDER BY keeps it; rows that tie on its sort key may
+    still move between pages. A bounded query is ordered by a hash of the
+    whole row, which costs little on a result it has to build anyway. A row
+    scan is ordered by the prefix of STREAM_ORDER_COLUMNS it returns, which
+    ClickHouse reads in order. A row scan returning neither is left
+    unordered: hashing would sort the whole scan on every page, so its pages
+    follow ClickHouse's read order and can overlap.
+    """
+    if has_order_by(sql):
+        return ""
+    if is_bounded(sql):
+        return " ORDER BY cityHash64(*)"
+    prefix = []
+    for column in STREAM_ORDER_COLUMNS:
+        if column not in columns:
+            break
+        prefix.append(column)
+    return " ORDER BY " + ", ".join(prefix) if prefix else ""
+
+
+def paginate_sql(sql, limit, offset=0, columns=()):
+    """Wraps a query in an outer LIMIT/OFFSET so any LIMIT the model wrote still applies inside it.
+
+    `columns` are the query's output column names, used to pick a page order
+    (see page_order).
+    """
+    sql = clean_sql(sql)
+    return f"SELECT * FROM (\n{sql}\n){page_order(sql, columns)} LIMIT {int(limit)} OFFSET {int(offset)}"
+
+
+def query_settings(max_rows):
+    """Per-query ClickHouse resource limits for Query Mode."""
+    return {
+        "max_result_rows": max_rows,
+        "result_overflow_mode": "break",
+        "max_execution_time": int(os.getenv("QUERY_MAX_EXECUTION_SECONDS", 15)),
+        "optimize_read_in_order": 1,
+        "max_memory_usage": int(os.getenv("QUERY_MAX_MEMORY_BYTES", 2 * 1024 ** 3)),
+    }
+
+
+# --- Pagination cursors ---
+# Cursors are signed rather than stored, so any worker can serve the next page
+# and a client cannot swap in its own SQL. Without QUERY_CURSOR_SECRET the key
+# is per-process and cursors only survive as long as the worker does.
+
+_CURSOR_SECRET = (os.getenv("QUERY_CURSOR_SECRET") or os.urandom(32).hex()).encode("utf-8")
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor is malformed or was not issued by this service."""
+
+
+def _sign(payload):
+    return hmac.new(_CURSOR_SECRET, payload, hashlib.sha256).hexdigest()[:32]
+
+
+def encode_cursor(sql, offset, page_size):
+    payload = base64.urlsafe_b64encode(
+        json.dumps({"sql": sql, "offset": offset, "pageSize": page_size}, separators=(",", ":")).encode("utf-8")
+    )
+    return f"{payload.decode('ascii')}.{_sign(payload)}"
+
+
+def decode_cursor(cursor):
+    """Returns (sql, offset, page_size) for a cursor produced by encode_cursor."""
+    try:
+        payload, signature = cursor.rsplit(".", 1)
+        if not hmac.compare_digest(signature, _sign(payload.encode("ascii"))):
+            raise InvalidCursorError("Cursor signature mismatch")
+        data = json.loads(base64.urlsafe_b64decode(payload.encode("ascii")))
+        return data["sql"], int(data["offset"]), int(data["pageSize"])
+    except InvalidCursorError:
+        raise
+    except Exception as e:
+        raise InvalidCursorError(f"Malformed cursor: {str(e)}")
@@ -15,6 +15,7 @@ const CareRadar = () => {
     avgResponseTime: 0
   });
   const [queryResult, setQueryResult] = useState(null);
+  const [prefetchedPatients, setPrefetchedPatients] = useState({});
   const [showSettings, setShowSettings] = useState(false);
   const [recentActivity, setRecentActivity] = useState([]);
   
@@ -41,14 +42,42 @@ const CareRadar = () => {
 
   useEffect(() => {
     if (activeMode === 'radar') {
-      fetchAlerts();
       if (preferences.autoRefresh) {
-        const interval = setInterval(fetchAlerts, 30000);
-        return () => clearInterval(interval);
+        // The backend pushes a snapshot on connect, then only new/changed alerts after each scan
+        const source = new EventSource('http://localhost:8000/api/alerts/stream');
+        source.addEventListener('snapshot', (event) => applyAlertSnapshot(JSON.parse(event.data)));
+        source.addEventListener('alerts', (event) => applyAlertChanges(JSON.parse(event.data)));
+        source.onerror = (error) => console.error('Alert stream error:', error);
+        return () => source.close();
       }
+      fetchAlerts();
     }
   }, [activeMode, preferences.autoRefresh]);
 
+  const applyAlertSnapshot = (data) => {
+    const alertsArray = Array.isArray(data.alerts) ? data.alerts : [];
+    setAlerts(alertsArray);
+    if (data.metrics) {
+      setMetrics(data.metrics);
+    }
+    addActivity('alert', `Radar scan completed: ${alertsArray.length} alerts found`);
+  };
+
+  const applyAlertChanges = (data) => {
+    setAlerts(prev => {
+      const byKey = new Map(prev.map(alert => [alert.key, alert]));
+      data.removed.forEach(key => byKey.delete(key));
+      data.changed.forEach(alert => byKey.set(alert.key, alert));
+      return data.order.map(key => byKey.get(key)).filter(Boolean);
+    });
+    if (data.metrics) {
+      setMetrics(data.metrics);
+    }
+    if (data.changed.length > 0) {
+      addActivity('alert', `Radar scan updated ${data.changed.length} alerts`);
+    }
+  };
+
   const fetchAlerts = async () => {
   try {
     const response = await fetch('http://localhost:8000/api/alerts');
@@ -86,16 +115,50 @@ const CareRadar = () => {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ question: query })
+        body: JSON.stringify({ question: query, stream: true })
       });
       
       if (!response.ok) {
         throw new Error('Query failed');
       }
       
-      const data = await response.json();
-      setQueryResult(data);
-      addActivity('query', `Searched: "${query}" - ${data.results.length} results`);
+      // The backend streams NDJSON events: sql, results, narrative deltas, done
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let result = { sql: '', results: [], narrative: '', executionTime: 0 };
+      
+      const handleEvent = (event) => {
+        if (event.type === 'error') {
+          throw new Error(event.detail);
+        }
+        if (event.type === 'sql') {
+          result = { ...result, sql: event.sql };
+        } else if (event.type === 'results') {
+          result = { ...result, results: event.results };
+          setIsLoading(false);
+          prefetchPatients(event.results.map(patient => patient.id));
+        } else if (event.type === 'narrative') {
+          result = { ...result, narrative: result.narrative + event.delta };
+        } else if (event.type === 'done') {
+          result = { ...result, executionTime: event.executionTime };
+        }
+        setQueryResult(result);
+      };
+      
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+      }
+      if (buffer.trim()) {
+        handleEvent(JSON.parse(buffer));
+      }
+      
+      addActivity('query', `Searched: "${query}" - ${result.results.length} results`);
       
     } catch (error) {
       console.error('Query failed:', error);
@@ -105,6 +168,31 @@ const CareRadar = () => {
     }
   };
 
+  // Warm the detail pages of a result set in one round-trip so clicking through them is instant
+  const prefetchPatients = async (ids) => {
+    // Aggregate queries have no patient_id and come back as 'Unknown'; don't profile those
+    const patientIds = [...new Set(ids)].filter(id => id && id !== 'Unknown');
+    if (patientIds.length === 0) return;
+    try {
+      const response = await fetch('http://localhost:8000/api/patients/batch', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ patient_ids: patientIds })
+      });
+      if (!response.ok) return;
+      const data = await response.json();
+      setPrefetchedPatients(prev => {
+        const next = { ...prev };
+        data.patients.forEach(patient => { next[patient.id] = patient; });
+        return next;
+      });
+    } catch (error) {
+      console.error('Patient prefetch failed:', error);
+    }
+  };
+
   const saveQuery = () => {
     if (query.trim() && !preferences.savedQueries.includes(query)) {
       setPreferences(prev => ({
@@ -125,6 +213,7 @@ const CareRadar = () => {
     return (
       <PatientDetail 
         patientId={selectedPatient}
+        prefetched={prefetchedPatients[selectedPatient]}
         onBack={() => setSelectedPatient(null)}
       />
     );
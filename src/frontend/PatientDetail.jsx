@@ -1,11 +1,16 @@
 import React, { useState, useEffect } from 'react';
 import { ArrowLeft, AlertTriangle, Calendar, Activity, TrendingUp, FileText, Clock, Phone, Mail, MapPin } from 'lucide-react';
 
-const PatientDetail = ({ patientId, onBack }) => {
-  const [patient, setPatient] = useState(null);
-  const [isLoading, setIsLoading] = useState(true);
+const PatientDetail = ({ patientId, prefetched, onBack }) => {
+  const [patient, setPatient] = useState(prefetched || null);
+  const [isLoading, setIsLoading] = useState(!prefetched);
 
   useEffect(() => {
+    if (prefetched) {
+      setPatient(prefetched);
+      setIsLoading(false);
+      return;
+    }
     fetchPatientDetail();
   }, [patientId]);
 